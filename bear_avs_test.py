@@ -1,23 +1,23 @@
 import os
 import sys
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 import json
 from lambda_function import *
-from test_fixtures import ABE_events, happening_intent
+from libeary import Snapshots, Tenants, open_store
+from test_fixtures import ABE_events, events, happening_intent
 
 # Confident that the output should be right. Mock is getting called but
 # somehow being processed incorrectly by the function.
 
 
 def test_whats_happening():
-    with patch('lambda_function.get_events') as mock:
-        instance = mock.return_value
-        instance.method.return_value = ABE_events
+    with patch('lambda_function.get_events', return_value=EventList(ABE_events)) as mock:
         result_next = handle_whats_happening_next_request(happening_intent)
         mock.assert_called_once()
         assert result_next == {'response': {'outputSpeech': {
-            'text': "I found 2 events coming up on the Olin calendar in the next week. On Tuesday at 05:00 AM, there's Olin Monday . On Monday at 04:00 AM, there's Spring Break .", 'type': 'PlainText'}}, 'version': '1.0'}
+            'text': "I found 2 events coming up on the Olin calendar in the next week. On Tuesday at 12:00 AM, there's Olin Monday . On Monday at 12:00 AM, there's Spring Break .", 'type': 'PlainText'}}, 'version': '1.0'}
 
         #result_on = handle_whats_happening_on_request(happening_on_intent)
         # assert result_on == {'response': {'outputSpeech': {'text': 'I found 0 events coming up on the Olin calendar in the next week.', 'type': 'PlainText'}}, 'version': '1.0'}
@@ -33,12 +33,14 @@ def test_whats_happening():
 
 
 def test_get_events():
-    with patch('lambda_function.request.urlopen') as mock_events:
-        instance = mock_events.return_value
-        instance.method.return_value = None
-        mock_events.assert_called_once()
-        assert get_events(start=datetime.strptime('2018-02-20', '%Y-%m-%d'),
-                          end=datetime.strptime('2018-04-20', '%Y-%m-%d')) == []
+    event_cache.clear()
+    body = (chunk for chunk in [json.dumps(events).encode()])
+    with patch('lambda_function.abe_client.stream', return_value=body) as mock_stream:
+        found = get_events(start=datetime.strptime('2018-02-20', '%Y-%m-%d'),
+                           end=datetime.strptime('2018-04-20', '%Y-%m-%d'))
+        mock_stream.assert_called_once()
+        assert [event.title for event in found] == ['Olin Monday', 'Spring Break']
+    event_cache.clear()
 
 # def test_get_events():
 # 	with patch('lambda_function.request.Request')as mock_events:
@@ -71,6 +73,305 @@ def test_get_events():
 
 # ...     intent.method.return_value = 'WhatsHappeningOn'
 
+def test_get_events_cached():
+    event_cache.clear()
+    with patch('lambda_function.fetch_events', return_value=EventList(ABE_events)) as mock_fetch:
+        week = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 27))
+        day = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 21))
+        # Within the prefetch horizon of the first request
+        later = get_events(start=datetime(2018, 3, 19), end=datetime(2018, 3, 20))
+        mock_fetch.assert_called_once()
+        assert [event.title for event in week] == ['Olin Monday']
+        assert [event.title for event in day] == ['Olin Monday']
+        assert [event.title for event in later] == ['Spring Break']
+    event_cache.clear()
+
+
+def test_concurrent_misses_share_one_fetch():
+    event_cache.clear()
+    release = threading.Event()
+    fetched = []
+
+    def fetch(*args, **kwargs):
+        fetched.append(args)
+        release.wait(1)
+        return EventList(ABE_events)
+
+    results = []
+    with patch('lambda_function.fetch_events', side_effect=fetch):
+        threads = [threading.Thread(target=lambda: results.append(
+            get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 27)))) for _ in range(3)]
+        coalesced = fetches.coalesced
+        for thread in threads:
+            thread.start()
+        while fetches.coalesced < coalesced + 2:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(1)
+    assert len(fetched) == 1
+    assert [[event.title for event in events] for events in results] == [['Olin Monday']] * 3
+    event_cache.clear()
+
+
+def test_days_are_local_days():
+    event_cache.clear()
+    evening = [ABEEvent({'id': 'e', 'title': 'Evening', 'start': '2030-01-02 01:00:00', 'end': '2030-01-02 02:00:00'})]
+    with patch('lambda_function.fetch_events', return_value=EventList(evening)) as mock_fetch:
+        response = lambda_handler(avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2030-01-01'}}),
+                                  None)
+        # ABE's days are UTC days, so a day either side is fetched too
+        assert mock_fetch.call_args[0][:2] == (datetime(2029, 12, 31), datetime(2030, 5, 2))
+        assert "On Tuesday at 08:00 PM, there's Evening" in response['response']['outputSpeech']['text']
+        response = lambda_handler(avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2030-01-02'}}),
+                                  None)
+        assert response['response']['outputSpeech']['text'].startswith('I found no events on Wednesday')
+        mock_fetch.assert_called_once()
+    event_cache.clear()
+
+
+def test_get_events_stale_while_revalidate():
+    event_cache.clear()
+    start, end = datetime(2018, 2, 20), datetime(2018, 2, 27)
+    event_cache.put('2018-02-20', '2018-02-27', ABE_events[:1], ttl=0)
+    refreshed = threading.Event()
+    with patch('lambda_function.fetch_events', return_value=EventList(ABE_events)) as mock_fetch, \
+            patch('lambda_function.event_cache.put', side_effect=lambda *args: refreshed.set()):
+        events = get_events(start=start, end=end)
+        assert events.stale
+        assert [event.title for event in events] == ['Olin Monday']
+        assert refreshed.wait(1)
+        mock_fetch.assert_called_once()
+    event_cache.clear()
+
+
+def test_get_events_stale_fallback():
+    event_cache.clear()
+    event_cache.put('2018-02-20', '2018-02-27', ABE_events[:1], ttl=0)
+    with patch('lambda_function.SERVE_STALE', False), patch('lambda_function.fetch_events', return_value=None):
+        events = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 27))
+        assert events.stale
+        assert [event.title for event in events] == ['Olin Monday']
+    event_cache.clear()
+
+
+def test_fetch_events_label_pushdown():
+    body = (chunk for chunk in [json.dumps(events).encode()])
+    with patch('lambda_function.LABEL_PUSHDOWN', True), \
+            patch('lambda_function.abe_client.stream', return_value=body) as mock_stream:
+        found = fetch_events(datetime(2018, 2, 20), datetime(2018, 2, 27), labels=['academic'])
+        assert mock_stream.call_args[0][1] == {'start': '2018-02-20', 'end': '2018-02-27', 'labels': 'academic'}
+        assert [event.title for event in found] == ['Olin Monday', 'Spring Break']
+
+
+def avs_request(intent_name, slots=None, session_attributes=None):
+    return {'session': {'attributes': session_attributes} if session_attributes else {},
+            'request': {'type': 'IntentRequest', 'intent': {'name': intent_name, 'slots': slots or {}}}}
+
+
+def test_paging_through_events():
+    event_cache.clear()
+    day = [ABEEvent({'id': str(hour), 'title': 'Event {}'.format(hour), 'start': '2018-02-20 {}:00:00'.format(hour),
+                     'end': '2018-02-20 {}:30:00'.format(hour)}) for hour in range(10, 15)]
+    event_cache.put('2018-02-20', '2018-02-21', day)
+    with patch('lambda_function.PAGE_SIZE', 2), patch('lambda_function.fetch_events') as mock_fetch:
+        response = lambda_handler(avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2018-02-20'}}),
+                                  None)
+        titles = []
+        while True:
+            text = response['response']['outputSpeech']['text']
+            titles += [title for title in ('Event {}'.format(hour) for hour in range(10, 15)) if title in text]
+            if 'sessionAttributes' not in response:
+                break
+            assert response['response']['shouldEndSession'] is False
+            assert text.endswith('Say "more" to hear the next {}.'.format(
+                min(2, len(response['sessionAttributes']['cursor']['ids']))))
+            assert response['response']['reprompt']['outputSpeech']['text'].startswith('Say "more"')
+            response = lambda_handler(avs_request('MoreEvents', session_attributes=response['sessionAttributes']),
+                                      None)
+        assert titles == ['Event {}'.format(hour) for hour in range(10, 15)]
+        mock_fetch.assert_not_called()
+    event_cache.clear()
+
+
+def test_whats_happening_next_featured():
+    event_cache.clear()
+    today = local_now(default_tenant).replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = format_date_url(today + timedelta(days=1), '%Y-%m-%d 18:00:00')
+    upcoming = [ABEEvent({'id': 'a', 'title': 'Tea Time', 'start': tomorrow, 'labels': ['featured']}),
+                ABEEvent({'id': 'b', 'title': 'Office Hours', 'start': tomorrow, 'labels': ['academic']})]
+    with patch('lambda_function.fetch_events', return_value=EventList(upcoming)):
+        response = lambda_handler(avs_request('WhatsHappeningNextFeatured'), None)
+    text = response['response']['outputSpeech']['text']
+    assert text.startswith('I found 1 events') and 'Tea Time' in text and 'Office Hours' not in text
+    assert [event.title for event in get_events(start=today, end=today + timedelta(days=7), labels='featured')] == [
+        'Tea Time']
+    event_cache.clear()
+
+
+def test_lambda_handler_records_metrics():
+    event_cache.clear()
+    event_cache.put('2018-02-20', '2018-02-21', ABE_events[:1])
+    emitted = []
+    sink = MagicMock(emit=emitted.append)
+    with patch('lambda_function.invocation_metrics', metrics.Metrics(sink)):
+        lambda_handler(avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2018-02-20'}}), None)
+    invocation, = emitted
+    assert invocation.name == 'WhatsHappeningOn'
+    assert {'intent_parse', 'filter', 'render', 'total'} <= set(invocation.timings)
+    assert invocation.values['cache_hits'] == 1 and 'cache_misses' not in invocation.values
+    event_cache.clear()
+
+
+def test_out_of_time_falls_back_to_the_cache():
+    event_cache.clear()
+    event_cache.put('2018-02-20', '2018-02-27', ABE_events[:1], ttl=0)
+    with patch('lambda_function.SERVE_STALE', False), patch('lambda_function.abe_client.stream') as mock_stream:
+        events = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 27), budget=Budget(0.2))
+        mock_stream.assert_not_called()
+        assert events.stale
+        assert [event.title for event in events] == ['Olin Monday']
+    event_cache.clear()
+
+
+def test_partial_answer_when_reading_runs_out_of_time():
+    event_cache.clear()
+    budget = Budget(3)
+    body = json.dumps(events).encode()
+
+    def slow_body():
+        yield body[:body.index(b'}, {') + 3]
+        budget.parse_deadline = 0  # Time's up before the next chunk
+        yield body[body.index(b'}, {') + 3:]
+
+    with patch('lambda_function.abe_client.stream', return_value=slow_body()):
+        found = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 21), budget=budget)
+        assert found.partial
+        assert [event.title for event in found] == ['Olin Monday']
+    assert event_cache.get('2018-02-20', '2018-02-21') is None
+    event_cache.clear()
+
+
+def test_partial_answer_when_reading_fails():
+    event_cache.clear()
+    body = json.dumps(events).encode()
+
+    def stalled_body():
+        yield body[:body.index(b'}, {') + 3]
+        raise ABEError('GET /events/ failed while reading: timed out')
+
+    with patch('lambda_function.abe_client.stream', return_value=stalled_body()) as mock_stream:
+        found = get_events(start=datetime(2018, 2, 20), end=datetime(2018, 2, 21), budget=Budget(3))
+        assert mock_stream.call_args[1]['read_deadline'] is not None
+        assert found.partial
+        assert [event.title for event in found] == ['Olin Monday']
+    event_cache.clear()
+
+
+def test_snapshot_handler_and_answering_from_the_snapshot(tmp_path):
+    event_cache.clear()
+    store = Snapshots(open_store(str(tmp_path)), check_interval=0)
+    today = local_now(default_tenant).replace(hour=0, minute=0, second=0, microsecond=0)
+    upcoming = [ABEEvent({'id': 'x', 'title': 'Tea Time', 'start': format_date_url(today, '%Y-%m-%d 20:00:00'),
+                          'end': format_date_url(today, '%Y-%m-%d 21:00:00'), 'labels': ['featured']})]
+    with patch('lambda_function.default_tenant.snapshots', store), \
+            patch('lambda_function.fetch_events', return_value=EventList(upcoming)) as mock_fetch:
+        summary = snapshot_handler({}, None)
+        assert summary['default']['events'] == 1
+        mock_fetch.reset_mock()
+        store.reload()  # As warm_up or a background check would
+        events = get_events(start=today, end=today + timedelta(days=1), labels=['featured'])
+        assert [event.title for event in events] == ['Tea Time']
+        mock_fetch.assert_not_called()
+        # Dates the snapshot doesn't cover are still fetched from ABE
+        get_events(start=today - timedelta(days=1), end=today)
+        mock_fetch.assert_called_once()
+    event_cache.clear()
+
+
+def test_answering_doesnt_wait_on_the_snapshot_store():
+    release = threading.Event()
+    store = MagicMock(version=lambda name: release.wait(1) and None)
+    snapshots = Snapshots(store, check_interval=0)
+    with patch('lambda_function.default_tenant.snapshots', snapshots):
+        began = time.monotonic()
+        assert latest_snapshot(default_tenant) is None
+        assert calendar_version() == (event_cache.version, None)
+        assert time.monotonic() - began < 0.5
+        release.set()
+
+
+def test_snapshot_handler_without_a_snapshot_location():
+    with patch('lambda_function.fetch_events') as mock_fetch:
+        assert snapshot_handler({}, None) == {}
+        mock_fetch.assert_not_called()
+
+
+def test_static_intents_dont_ask_abe():
+    with patch('lambda_function.get_events') as mock_get_events:
+        help_response = lambda_handler(avs_request('AMAZON.HelpIntent'), None)
+        assert help_response['response']['shouldEndSession'] is False
+        assert 'What would you like to know?' in help_response['response']['outputSpeech']['text']
+        assert help_response['response']['reprompt']['outputSpeech']['text'] == 'What would you like to know?'
+        for name in ('AMAZON.StopIntent', 'AMAZON.CancelIntent'):
+            response = lambda_handler(avs_request(name), None)
+            assert response['response'] == {'outputSpeech': {'type': 'PlainText', 'text': 'Goodbye.'},
+                                            'shouldEndSession': True}
+        launch = lambda_handler({'request': {'type': 'LaunchRequest'}}, None)
+        assert launch['response']['outputSpeech']['text'].startswith('Welcome')
+        unknown = lambda_handler(avs_request('OrderPizza'), None)
+        assert unknown['response']['outputSpeech']['text'] == "I didn't recognize the intent OrderPizza"
+        mock_get_events.assert_not_called()
+
+
+def test_session_ended_requests_get_an_empty_response():
+    with patch('lambda_function.get_events') as mock_get_events:
+        for reason in ('USER_INITIATED', 'EXCEEDED_MAX_REPROMPTS', 'ERROR'):
+            response = lambda_handler({'request': {'type': 'SessionEndedRequest', 'reason': reason}}, None)
+            assert response == {'version': '1.0', 'response': {}}
+        unknown = lambda_handler({'request': {'type': 'CanFulfillIntentRequest'}}, None)
+        assert unknown['response']['outputSpeech']['text'] == "I didn't recognize the intent CanFulfillIntentRequest"
+        mock_get_events.assert_not_called()
+
+
+def test_whats_happening_on_responses_are_reused_until_the_calendar_changes():
+    event_cache.clear()
+    event_cache.put('2018-02-20', '2018-02-21', ABE_events[:1])
+    request = avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2018-02-20'}})
+    first = lambda_handler(request, None)
+    with patch('lambda_function.get_events') as mock_get_events:
+        assert lambda_handler(request, None) is first
+        mock_get_events.assert_not_called()
+    event_cache.put('2018-02-20', '2018-02-21', ABE_events[:1] + [ABEEvent({
+        'id': 'x', 'title': 'Tea Time', 'start': '2018-02-20 20:00:00', 'end': '2018-02-20 21:00:00'})])
+    second = lambda_handler(request, None)
+    assert 'Tea Time' in second['response']['outputSpeech']['text']
+    event_cache.clear()
+
+
+def test_requests_are_answered_from_their_skills_calendar():
+    tenants = Tenants.from_config({'skill-b': {'url': 'http://b.example', 'zone': 'America/Los_Angeles'}},
+                                  url='http://a.example')
+    _, b = tenants
+    b.event_cache.put('2018-02-20', '2018-02-21', [b.event_class({'id': 'x', 'title': 'Tea Time',
+                                                                  'start': '2018-02-20 22:00:00'})])
+    request = avs_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': '2018-02-20'}})
+    request['session']['application'] = {'applicationId': 'skill-b'}
+    with patch('lambda_function.tenants', tenants), patch('lambda_function.fetch_events') as mock_fetch:
+        response = lambda_handler(request, None)
+        mock_fetch.assert_not_called()
+    assert 'On Tuesday at 02:00 PM, there\'s Tea Time' in response['response']['outputSpeech']['text']
+
+    # Its days are Pacific days: 05:00 UTC on Tuesday is still Monday evening
+    b.event_cache.put('2018-02-19', '2018-02-21', [b.event_class(events[0])])
+    with patch('lambda_function.tenants', tenants):
+        tuesday = lambda_handler(request, None)['response']['outputSpeech']['text']
+        request['request']['intent']['slots']['date']['value'] = '2018-02-19'
+        monday = lambda_handler(request, None)['response']['outputSpeech']['text']
+    assert 'Olin Monday' not in tuesday
+    assert 'On Monday at 09:00 PM, there\'s Olin Monday' in monday
+
+
 def test_format_date_url():
     assert format_date_url(datetime.strptime('2007-05-12', '%Y-%m-%d'), '%Y-%m-%d') == '2007-05-12'
     assert format_date_url(datetime.strptime('2007-05-12', '%Y-%m-%d'), '%Y-%d-%m') == '2007-12-05'
@@ -87,3 +388,12 @@ def test_prepare_response():
             'outputSpeech': {
                 'type': 'PlainText', 'text': 'There was a problem speaking to ABEEvent'
             }}}
+
+
+def test_prepare_ssml_response():
+    assert prepare_response('<speak>Hello</speak>', ssml=True) == {
+        'version': '1.0',
+        'response': {
+            'outputSpeech': {
+                'type': 'SSML', 'ssml': '<speak>Hello</speak>'
+            }}}
@@ -0,0 +1,47 @@
+"""
+Generates synthetic ABE calendars for the benchmarks and the fake ABE server.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+LABELS = ['academic', 'featured', 'library', 'clubs', 'sports', 'arts', 'career', 'social']
+TITLES = ['Study Break', 'Library Hours', 'Robotics Club', 'Career Fair', 'Open Studio', 'Board Game Night',
+          'Guest Lecture', 'Ultimate Practice', 'Tea Time', 'Hackathon']
+LOCATIONS = ['the Library', 'the Dining Hall', 'Academic Center 109', 'the Great Lawn', 'Milas Hall', None]
+
+
+def generate_events(count, start=None, days=120, seed=0):
+    """
+    Makes a calendar of events as ABE would return them from /events/, spread over a number of days and sorted by
+    start time.
+    :param {int} count: the number of events
+    :param {datetime} start: (optional) the first day of the calendar; defaults to today
+    :param {int} days: the number of days the events are spread over
+    :param {int} seed: the random seed, so that runs are reproducible
+    :return {list}: the events, as JSON-style dictionaries
+    """
+    rng = random.Random(seed)
+    start = datetime.combine((start or datetime.now()).date(), datetime.min.time())
+    events = []
+    for number in range(count):
+        begins = start + timedelta(minutes=rng.randrange(days * 24 * 4) * 15)
+        all_day = rng.random() < 0.05
+        if all_day:
+            begins = begins.replace(hour=5, minute=0)
+        ends = begins + (timedelta(days=1, seconds=-1) if all_day else timedelta(minutes=30 * rng.randint(1, 6)))
+        event = {
+            'id': '{:024x}'.format(number),
+            'title': rng.choice(TITLES),
+            'start': begins.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': ends.strftime('%Y-%m-%d %H:%M:%S'),
+            'allDay': all_day,
+            'labels': rng.sample(LABELS, rng.randint(0, 3)),
+            'sub_events': [],
+        }
+        location = rng.choice(LOCATIONS)
+        if location:
+            event['location'] = location
+        events.append(event)
+    events.sort(key=lambda event: event['start'])
+    return events
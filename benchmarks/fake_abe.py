@@ -0,0 +1,128 @@
+"""
+A local stand-in for the ABE server, serving a synthetic calendar with configurable latency and failure rate.
+
+    python benchmarks/fake_abe.py --events 2000 --latency 0.2 --failure-rate 0.05 --port 8765
+
+Then point the Lambda function at it with ABE_URL=http://127.0.0.1:8765.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+from calendars import generate_events
+
+
+class FakeABEServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, events, latency=0.0, jitter=0.0, failure_rate=0.0):
+        """
+        :param {tuple} address: the (host, port) to listen on; port 0 picks a free port
+        :param {list} events: the calendar, as JSON-style dictionaries sorted by start time
+        :param {float} latency: the seconds to wait before answering each request
+        :param {float} jitter: up to this many extra seconds are added to the latency at random
+        :param {float} failure_rate: the fraction of requests answered with a 503
+        """
+        super().__init__(address, _Handler)
+        self.events = events
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def query(self, params):
+        """Filters the calendar like ABE's /events/ endpoint does."""
+        events = self.events
+        start, end = params.get('start', [None])[0], params.get('end', [None])[0]
+        if start and end:
+            events = [event for event in events if start <= event['start'][:10] < end]
+        labels = params.get('labels', [None])[0]
+        if labels:
+            wanted = set(labels.split(','))
+            events = [event for event in events if wanted.intersection(event['labels'])]
+        return events
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like Heroku's router
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        time.sleep(server.latency + random.random() * server.jitter)
+        parts = urlsplit(self.path)
+        if parts.path.rstrip('/') != '/events':
+            return self._respond(404, b'')
+        if random.random() < server.failure_rate:
+            return self._respond(503, b'')
+
+        body = json.dumps(server.query(parse_qs(parts.query))).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self._respond(304, b'', {'ETag': etag})
+        headers = {'Content-Type': 'application/json', 'ETag': etag}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        self._respond(200, body, headers)
+
+    def _respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(events=1000, latency=0.0, jitter=0.0, failure_rate=0.0, port=0, seed=0):
+    """
+    Starts a fake ABE server on a background thread.
+    :return {FakeABEServer}: the running server; call shutdown() to stop it
+    """
+    server = FakeABEServer(('127.0.0.1', port), generate_events(events, seed=seed), latency, jitter, failure_rate)
+    threading.Thread(target=server.serve_forever, name='fake-abe', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000, help='the number of events in the calendar')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds of latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='the fraction of requests that fail')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeABEServer(('127.0.0.1', args.port), generate_events(args.events, seed=args.seed),
+                           args.latency, args.jitter, args.failure_rate)
+    print('Serving {} events at {}'.format(args.events, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
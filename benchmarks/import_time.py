@@ -0,0 +1,64 @@
+"""
+Measures how long a cold start of the Lambda function takes: importing lambda_function, then answering a
+LaunchRequest. Each run is a fresh interpreter, as on a new container.
+
+    python benchmarks/import_time.py [--runs 20]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import time
+began = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+lambda_function.lambda_handler({'request': {'type': 'LaunchRequest'}}, None)
+answered = time.perf_counter()
+print(imported - began, answered - imported)
+'''
+
+
+def measure(runs):
+    env = dict(os.environ, ABE_WARMUP='false')
+    imports, launches = [], []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT, env=env)
+        imported, answered = map(float, output.split())
+        imports.append(imported * 1000)
+        launches.append(answered * 1000)
+    return imports, launches
+
+
+def slowest_imports(count=10):
+    """Lists the modules that contribute most to the import time (self time, per `python -X importtime`)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import lambda_function'],
+                            cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines()[1:]:
+        self_us, _, name = line.split('|')
+        rows.append((int(self_us.split(':')[1]), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    imports, launches = measure(args.runs)
+    print('import lambda_function: median {:.1f} ms, max {:.1f} ms'.format(statistics.median(imports), max(imports)))
+    print('first LaunchRequest:    median {:.2f} ms, max {:.2f} ms'.format(statistics.median(launches),
+                                                                          max(launches)))
+    print('slowest imports (self time):')
+    for self_us, name in slowest_imports():
+        print('  {:8.1f} ms  {}'.format(self_us / 1000, name))
+
+
+if __name__ == '__main__':
+    main()
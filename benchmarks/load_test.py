@@ -0,0 +1,145 @@
+"""
+Replays AVS requests through lambda_handler at a set concurrency, against a fake (or real) ABE server, and reports
+latency percentiles, throughput and memory.
+
+    python benchmarks/load_test.py --requests 2000 --concurrency 8 --events 5000 --latency 0.1 --failure-rate 0.02
+
+Pass --payloads with a JSON file holding a list of AVS request payloads to replay instead of the built-in mix, and
+--abe-url to run against a real ABE server instead of starting a fake one. Allocation tracing slows everything down,
+so --trace-memory measures the peak traced memory in a second pass (from cold caches) after the timed one, rather than
+during it.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fake_abe import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeContext:
+    """Stands in for the Lambda context object, counting down from the function's timeout."""
+
+    def __init__(self, timeout):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def intent_request(name, slots=None):
+    return {'session': {}, 'request': {'type': 'IntentRequest', 'intent': {'name': name, 'slots': slots or {}}}}
+
+
+def default_payloads(days=30):
+    """A mix of what people ask the bear, weighted towards "what's happening next"."""
+    today = datetime.now()
+    payloads = [{'request': {'type': 'LaunchRequest'}}]
+    payloads += [intent_request('WhatsHappeningNext')] * 6
+    payloads += [intent_request('WhatsHappeningNextFeatured')] * 2
+    for day in range(days):
+        date = (today + timedelta(days=day)).strftime('%Y-%m-%d')
+        payloads.append(intent_request('WhatsHappeningOn', {'date': {'name': 'date', 'value': date}}))
+    return payloads
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(handler, payloads, requests, concurrency, timeout, seed=0):
+    """
+    Sends requests through the handler from a pool of threads.
+    :return {tuple}: (latencies in seconds, number of failed requests, elapsed seconds)
+    """
+    rng = random.Random(seed)
+    chosen = [rng.choice(payloads) for _ in range(requests)]
+
+    def invoke(payload):
+        began = time.perf_counter()
+        try:
+            response = handler(payload, FakeContext(timeout))
+            failed = 'problem speaking to ABE' in json.dumps(response)
+        except Exception:
+            failed = True
+        return time.perf_counter() - began, failed
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(invoke, chosen))
+    elapsed = time.perf_counter() - began
+    return [latency for latency, _ in results], sum(failed for _, failed in results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=3, help="the Lambda function's timeout, in seconds")
+    parser.add_argument('--payloads', help='a JSON file with a list of AVS request payloads')
+    parser.add_argument('--abe-url', help='use this ABE server instead of starting a fake one')
+    parser.add_argument('--events', type=int, default=1000, help='the size of the fake calendar')
+    parser.add_argument('--latency', type=float, default=0.0, help="the fake server's latency, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency, in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='the fraction of fake requests that fail')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure peak traced memory in a second, untimed pass')
+    args = parser.parse_args()
+
+    server = None
+    if not args.abe_url:
+        server = start_server(args.events, args.latency, args.jitter, args.failure_rate, seed=args.seed)
+    os.environ['ABE_URL'] = args.abe_url or server.url  # Read when lambda_function is imported
+    sys.path.insert(0, ROOT)
+    import lambda_function
+
+    if args.payloads:
+        with open(args.payloads) as f:
+            payloads = json.load(f)
+    else:
+        payloads = default_payloads()
+
+    latencies, failures, elapsed = run(lambda_function.lambda_handler, payloads, args.requests, args.concurrency,
+                                       args.timeout, args.seed)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    hit_ratio = lambda_function.event_cache.hit_ratio
+
+    peak = None
+    if args.trace_memory:
+        for tenant in lambda_function.tenants:
+            tenant.event_cache.clear()
+            tenant.response_cache.clear()
+        tracemalloc.start()
+        run(lambda_function.lambda_handler, payloads, args.requests, args.concurrency, args.timeout, args.seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    print('requests:    {} ({} failed) at concurrency {}'.format(len(latencies), failures, args.concurrency))
+    print('throughput:  {:.1f} requests/s'.format(len(latencies) / elapsed))
+    print('latency:     p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        *(1000 * value for value in (percentile(latencies, 0.5), percentile(latencies, 0.95),
+                                     percentile(latencies, 0.99), latencies[-1]))))
+    print('memory:      {:.1f} MB max RSS{}'.format(
+        max_rss, '' if peak is None else ', {:.1f} MB peak traced (separate pass)'.format(peak / 2 ** 20)))
+    print('event cache: {:.0%} hit ratio'.format(hit_ratio))
+    print('coalesced:   {} cache-miss fetches, {} requests waited on one'.format(
+        lambda_function.fetches.calls, lambda_function.fetches.coalesced))
+    if server:
+        print('fake ABE:    {} requests'.format(server.requests))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
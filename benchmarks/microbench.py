@@ -0,0 +1,141 @@
+"""
+Microbenchmarks for the hot paths in libeary and lambda_function, over generated calendars of 10 to 100k events.
+
+    python benchmarks/microbench.py --save-baseline     # record the current numbers
+    python benchmarks/microbench.py                     # compare against them; exits 1 on a regression
+
+Each case reports the best time per event (or per request) over several samples. A case regresses when it is more
+than --threshold slower than the baseline; compare numbers from the same machine only.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from calendars import LABELS, generate_events
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('ABE_WARMUP', 'false')
+
+from lambda_function import handle_request, prepare_response  # noqa: E402
+from libeary import ABEEvent, AVSIntent  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def make_cases(items):
+    """
+    Builds the benchmark cases for a calendar. Each case is a function that processes the whole calendar once.
+    :param {list} items: the calendar, as ABE's JSON objects
+    :return {dict}: case name -> function
+    """
+    events = ABEEvent.from_list(items)
+    for event in events:
+        event.start  # Parse ahead of the cases that need it
+    payloads = [{'session': {}, 'request': {'type': 'IntentRequest', 'intent': {
+        'name': 'WhatsHappeningOn', 'slots': {
+            'date': {'name': 'date', 'value': item['start'][:10]},
+            'time': {'name': 'time'}}}}} for item in items]
+    help_payload = {'session': {}, 'request': {'type': 'IntentRequest', 'intent': {'name': 'AMAZON.HelpIntent'}}}
+    texts = ["{}, there's {}.".format(item['start'], item['title']) for item in items]
+    wanted = LABELS[:2]
+    parse = ABEEvent._parse_date_time
+    return {
+        'ABEEvent.__init__': lambda: [ABEEvent(item) for item in items],
+        'ABEEvent.from_list': lambda: ABEEvent.from_list(items),
+        'ABEEvent._parse_date_time': lambda: [parse(item['start']) for item in items],
+        'ABEEvent.localize': lambda: ABEEvent.localize(ABEEvent.from_list(items)),
+        'ABEEvent.has_labels': lambda: [event.has_labels(wanted) for event in events],
+        'ABEEvent.get_start_speech': lambda: [event.get_start_speech() for event in events],
+        'AVSIntent': lambda: [AVSIntent(payload) for payload in payloads],
+        'prepare_response': lambda: [prepare_response(text) for text in texts],
+        'handle_request (AMAZON.HelpIntent)': lambda: [handle_request(help_payload, None) for _ in items],
+    }
+
+
+def time_case(function, count, min_sample=0.05, samples=5):
+    """
+    Times a case, repeating it enough that each sample takes at least min_sample seconds.
+    :return {float}: the best time per item, in nanoseconds
+    """
+    function()  # Warm up
+    loops = 1
+    while True:
+        began = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - began
+        if elapsed >= min_sample:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(samples - 1):
+        began = time.perf_counter()
+        for _ in range(loops):
+            function()
+        best = min(best, time.perf_counter() - began)
+    return best / loops / count * 1e9
+
+
+def run(sizes, only=None):
+    results = {}
+    for size in sizes:
+        items = generate_events(size)
+        for name, function in make_cases(items).items():
+            if only and only not in name:
+                continue
+            results['{} @ {}'.format(name, size)] = time_case(function, size)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the results next to the baseline.
+    :return {list}: the names of the cases that regressed by more than the threshold
+    """
+    regressions = []
+    for name, value in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print('{:45} {:10.0f} ns'.format(name, value))
+            continue
+        change = value / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('{:45} {:10.0f} ns  (baseline {:.0f} ns, {:+.0%}){}'.format(name, value, before, change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='calendar sizes to run')
+    parser.add_argument('--only', help='only run cases whose name contains this')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='the baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='the slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.only)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(baseline, **results), f, indent=2, sort_keys=True)
+        print('Saved the baseline to', args.baseline)
+    elif regressions:
+        print('{} case(s) regressed by more than {:.0%}'.format(len(regressions), args.threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,54 +1,158 @@
 from datetime import datetime, timedelta
-from urllib import request
-import json
+import logging
+import os
+import time
 # changed the next import so that lambda_function needn't know the internal
 # organization of the libeary package
-from libeary import ABEEvent, AVSIntent
+from libeary import (ABEError, ABEEvent, AVSIntent, BackgroundRefresher, Budget, Dispatcher, EventIndex, EventList,
+                     OutOfTime, SingleFlight, Tenants, gather_events, metrics)
+from libeary.event_stream import iter_events
+from libeary.speech import render_events
+from libeary.timezones import parse_date
+
+# Module-level so that connections and events fetched by one invocation are
+# reused by the next invocations of the same warm container.
+#
+# Each tenant is one calendar, with its own ABE client, event cache (which
+# gets an equal share of ABE_CACHE_MAX_EVENTS), cache of finished answers to
+# popular questions, and snapshots (as saved by snapshot_handler to
+# ABE_SNAPSHOT: 's3://bucket/prefix/' or a local directory). ABE_TENANTS maps
+# the AVS application IDs of further skills to their own calendars, as JSON,
+# e.g. {"amzn1.ask.skill.…": {"url": "https://…", "zone": "America/Chicago"}};
+# requests from other skills are answered from the ABE_URL calendar.
+tenant_config = {}
+if os.environ.get('ABE_TENANTS'):
+    import json  # Only imported on a cold start when it's needed
+    tenant_config = json.loads(os.environ['ABE_TENANTS'])
+tenants = Tenants.from_config(tenant_config,
+                              max_events=int(os.environ.get('ABE_CACHE_MAX_EVENTS', 5000)),
+                              url=os.environ.get('ABE_URL', 'https://abe-dev.herokuapp.com'),
+                              ttl=int(os.environ.get('ABE_CACHE_TTL', 300)),
+                              max_stale=int(os.environ.get('ABE_CACHE_MAX_STALE', 86400)),
+                              response_cache_size=int(os.environ.get('ABE_RESPONSE_CACHE_SIZE', 256)),
+                              snapshot=os.environ.get('ABE_SNAPSHOT'))
+default_tenant = tenants.default
+# The default tenant's, for code that only deals with one calendar
+abe_client = default_tenant.client
+event_cache = default_tenant.event_cache
+response_cache = default_tenant.response_cache
+snapshots = default_tenant.snapshots
+refresher = BackgroundRefresher()
+# Concurrent requests (e.g. on a burst of invocations of a multi-threaded
+# container) that miss the cache for the same range wait on one fetch from ABE
+fetches = SingleFlight()
+
+logger = logging.getLogger(__name__)
+
+# Phase timings are written to the log as CloudWatch Embedded Metric Format
+# lines when running on Lambda (ABE_METRICS=emf), and not recorded at all
+# locally (ABE_METRICS=none).
+invocation_metrics = metrics.Metrics(
+    metrics.EMFSink() if os.environ.get('ABE_METRICS', 'emf' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'none')
+    == 'emf' else metrics.NullSink(),
+    sample_rate=float(os.environ.get('ABE_METRICS_SAMPLE_RATE', 1)))
+
+# When set, a stale cached range is spoken right away and refreshed in the
+# background, instead of making the user wait on ABE (which can take a while
+# to wake up on Heroku).
+SERVE_STALE = os.environ.get('ABE_SERVE_STALE', 'true').lower() in ('1', 'true', 'yes')
+# Seconds to wait on ABE for the request the user is waiting on, and for a
+# background refresh
+FETCH_TIMEOUT = float(os.environ.get('ABE_FETCH_TIMEOUT', 2))
+REFRESH_TIMEOUT = float(os.environ.get('ABE_REFRESH_TIMEOUT', 10))
+# A cache miss fetches at least this many days from ABE (about a term), so
+# that later questions about other days are answered from the cached index.
+PREFETCH_DAYS = int(os.environ.get('ABE_PREFETCH_DAYS', 120))
+# ABE's start and end parameters are UTC days, which don't line up with local
+# ones, so ranges of local days are fetched with this much to spare on either
+# side, and the event index cuts the local days out of them.
+ABE_DAY_MARGIN = timedelta(days=1)
+# Set when the ABE server supports filtering by the `labels` query parameter,
+# so that labelled queries only download the events they need.
+LABEL_PUSHDOWN = os.environ.get('ABE_LABEL_PUSHDOWN', 'false').lower() in ('1', 'true', 'yes')
+# Set to answer with SSML rather than plain text
+SSML = os.environ.get('ABE_SSML', 'false').lower() in ('1', 'true', 'yes')
+# When set, event lists longer than this are read out this many at a time,
+# with "more" reading the next page (from the cache) on the next turn.
+PAGE_SIZE = int(os.environ.get('ABE_PAGE_SIZE', 0))
+# Set to use Lambda's init phase (which isn't billed, and has a longer time
+# limit than an invocation) to connect to ABE and load the coming events.
+WARMUP = os.environ.get('ABE_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+WARMUP_TIMEOUT = float(os.environ.get('ABE_WARMUP_TIMEOUT', 5))
+# A snapshot older than this many seconds (e.g. because the scheduled
+# snapshot_handler has been failing) isn't used.
+SNAPSHOT_MAX_AGE = int(os.environ.get('ABE_SNAPSHOT_MAX_AGE', 86400))
 
 
 def lambda_handler(req, context):
     """
     Entry function (called by AWS)
     :param req: a dictionary with the JSON values sent from AVS
-    :param context: don't know what this is
+    :param context: the Lambda context object, which says how much time the invocation has left
     :return: a dictionary (to be formatted as a JSON string)
     """
+    invocation_metrics.start()
+    tenant = tenants.for_request(req)
+    try:
+        return handle_request(req, context, tenant)
+    finally:
+        invocation_metrics.finish()
 
-    # Convert the server request to an AVSIntent object
-    intent = AVSIntent(req)
 
-    # Check if the user just opened the Skill (without specifying any actions)
-    if intent.is_launch_request:
-        return prepare_response('Welcome to the ABE, the Olin calendar. How may I help you?')
+def handle_request(req, context, tenant=None):
+    """
+    Answers a request from AVS.
+    :param req: a dictionary with the JSON values sent from AVS
+    :param context: the Lambda context object, which says how much time the invocation has left
+    :param {Tenant} tenant: (optional) the calendar to answer from; by default, the one for the skill that sent the
+    request
+    :return: a dictionary (to be formatted as a JSON string)
+    """
+    # ABE requests have to finish in time for us to answer before Lambda's timeout
+    budget = Budget.from_context(context)
 
-    # Check if the user wants to know what's happening next
-    elif intent.name == 'WhatsHappeningNext':
-        return handle_whats_happening_next_request(intent)
+    # Convert the server request to an AVSIntent object
+    invocation = metrics.current()
+    with invocation.phase('intent_parse'):
+        intent = AVSIntent(req)
+    invocation.name = Dispatcher.name_of(intent)
 
-    # Check if the user wants to know what featured events are happening next
-    elif intent.name == 'WhatsHappeningNextFeatured':
-        return handle_whats_happening_next_request(intent, 'featured')
+    return dispatcher.dispatch(intent, budget=budget, tenant=tenant or tenants.for_request(req))
 
-    elif intent.name == 'WhatsHappeningOn':  # Look up what's happening on/at a specific day/time
-        return handle_whats_happening_on_request(intent)
 
+def handle_unrecognized_intent(intent, budget=None, tenant=None):
+    """
+    Answers an intent that has no handler.
+    :param {AVSIntent} intent: the intent from AVS
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to answer from; defaults to the default tenant's
+    :return {dict}: a response to be sent back to AVS
+    """
     # There was a problem interpreting the intent
     # This is a developer-centered message. Consider wording aimed at the user
     # of the system.
     # Stretch: log errors for analysis as to popular unrecognized intents to
     # implement next. (Maybe AWS already has a mechanism for this?)
-    return prepare_response("I didn't recognize the intent " + intent.name)
+    return prepare_response("I didn't recognize the intent " + Dispatcher.name_of(intent))
+
+
+# Intent name -> handler. The handlers below register themselves.
+dispatcher = Dispatcher(fallback=handle_unrecognized_intent)
 
 
-def handle_whats_happening_next_request(intent, labels=None):
+@dispatcher.handler('WhatsHappeningNext')  # Check if the user wants to know what's happening next
+def handle_whats_happening_next_request(intent, labels=None, budget=None, tenant=None):
     """
     This function queries ABE for events happening in the next week. It handles the "WhatsHappeningNext" request from AVS.
     :param {AVSIntent} intent: the intent from AVS
     :param {list} labels: a list of labels to filter events by
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to answer from; defaults to the default tenant's
     :return {list}: the events found in the next week
     """
     # Resolve the dates to look between
-    today = datetime.now()
+    tenant = tenant or default_tenant
+    today = local_now(tenant)
     # timedelta is a good candidate for (1) a global, or (2) a configurable
     # global, e.g. via an environment variable. The admin documentation can
     # document configuration options, and whether they're found in the code or
@@ -56,7 +160,7 @@ def handle_whats_happening_next_request(intent, labels=None):
     week_from_today = today + timedelta(weeks=1)
 
     # Get the events
-    events = get_events(start=today, end=week_from_today, labels=labels)
+    events = get_events(start=today, end=week_from_today, labels=labels, budget=budget, tenant=tenant)
     # If there is an error, consider reporting this fact to the user so they
     # don't erroneously think nothing is scheduled. (This is less critical
     # with current uses of ABE. It could be more critical if you were
@@ -65,33 +169,54 @@ def handle_whats_happening_next_request(intent, labels=None):
         return prepare_abe_connectivity_problem_response()
 
     # Build the response
-    text_res = 'I found {} events coming up on the Olin calendar in the next week.'.format(len(events))
+    intro = 'I found {}{} events coming up on the Olin calendar in the next week.'.format(
+        'at least ' if events.partial else '', len(events))
     # In Python 3.6, you can also say f'I found #{len(events)} events…'
-    for event in events:
-        text_res += " {}, there's {} {}.".format(event.get_start_speech(),
-                                                 event.title, 'in ' + event.location if event.location else '')
+    return prepare_events_response(intro, events, today, week_from_today, labels, budget=budget)
 
-    return prepare_response(text_res)
+
+@dispatcher.handler('WhatsHappeningNextFeatured')
+def handle_whats_happening_next_featured_request(intent, budget=None, tenant=None):
+    """
+    Like handle_whats_happening_next_request, but only for featured events. It handles the "WhatsHappeningNextFeatured"
+    intent from AVS.
+    :param {AVSIntent} intent: the intent from AVS
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to answer from; defaults to the default tenant's
+    :return {dict}: a response to be sent back to AVS
+    """
+    return handle_whats_happening_next_request(intent, ['featured'], budget=budget, tenant=tenant)
 
 
-def handle_whats_happening_on_request(intent):
+@dispatcher.handler('WhatsHappeningOn')  # Look up what's happening on/at a specific day/time
+def handle_whats_happening_on_request(intent, budget=None, tenant=None):
     """
     This function queries ABE for events happening on a specific date. It handles the "WhatsHappeningOn" intent from AVS.
     :param {AVSIntent} intent: the intent from AVS
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to answer from; defaults to the default tenant's
     :return {list}: the events found on the given date
     """
-    # Convert intent date to Python date
+    # Popular dates ("tomorrow") are answered again and again until the calendar changes
+    tenant = tenant or default_tenant
     date = intent.slots['date'].value
+    key = (intent.name, date, None)
+    response = tenant.response_cache.get(key, calendar_version(tenant))
+    if response is not None:
+        metrics.current().count('response_cache_hits')
+        return response
+
+    # Convert intent date to Python date
     # '%Y-%m-%d' looks like it's defined by the skill. Does the skill
     # documentation give this format a name that you can use as a global
     # variable, for documentation as to where the string is coming from /
     # what it means? You could define this in libeary, to move more AWS
     # specifics there.
-    date = datetime.strptime(date, '%Y-%m-%d')
+    date = parse_date(date)  # '%Y-%m-%d', without strptime's import and parsing overhead
     tomorrow_morning = date + timedelta(days=1)  # The end time for our query
 
     # Get the events
-    events = get_events(start=date, end=tomorrow_morning)
+    events = get_events(start=date, end=tomorrow_morning, budget=budget, tenant=tenant)
     # Same as previous comment. Which suggests factoring the common code from
     # handle_whats_happening_next_request and handle_whats_happening_on_request.
     # Also (now that I see this a second time), it would make sense for
@@ -104,13 +229,104 @@ def handle_whats_happening_on_request(intent):
     # Build the response
     date_as_words = date.strftime('%A, %B %d')
     count = len(events)
-    text_res = 'I found {} event{} on {}.'.format(
-        'no' if count == 0 else count, '' if count == 1 else 's', date_as_words)
-    for event in events:
-        text_res += " {}, there's {} {}.".format(event.get_start_speech(),
-                                                 event.title, 'in ' + event.location if event.location else '')
+    intro = 'I found {}{} event{} on {}.'.format('at least ' if events.partial else '', 'no' if count == 0 else count,
+                                                 '' if count == 1 else 's', date_as_words)
+    response = prepare_events_response(intro, events, date, tomorrow_morning, budget=budget)
+    # Only complete, up-to-date answers are worth repeating
+    if not (events.stale or events.partial or budget and budget.max_events() is not None):
+        tenant.response_cache.put(key, calendar_version(tenant), response)
+    return response
 
-    return prepare_response(text_res)
+
+@dispatcher.handler('AMAZON.NextIntent', 'AMAZON.MoreIntent', 'MoreEvents')  # Carry on reading a long list
+def handle_more_events_request(intent, budget=None, tenant=None):
+    """
+    Reads the next page of a list of events that was too long to read in one go. The list is identified by the
+    cursor that prepare_events_response left in the session, and its events are looked up in the cache.
+    :param {AVSIntent} intent: the intent from AVS
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to answer from; defaults to the default tenant's
+    :return {dict}: a response to be sent back to AVS
+    """
+    cursor = intent.session_attributes.get('cursor')
+    if not cursor:
+        return prepare_response("I don't have any more events to read.")
+
+    page_ids = cursor['ids'][:PAGE_SIZE or len(cursor['ids'])]
+    page = (tenant or default_tenant).event_cache.find(cursor['start'], cursor['end'], page_ids, cursor.get('labels'))
+    if page is None:  # The list has been evicted from the cache since the last turn
+        events = get_events(start=parse_date(cursor['start']), end=parse_date(cursor['end']),
+                            labels=cursor.get('labels'), budget=budget, tenant=tenant)
+        if events is None:
+            return prepare_abe_connectivity_problem_response()
+        by_id = {event.id: event for event in events}
+        page = [by_id[event_id] for event_id in page_ids if event_id in by_id]
+
+    remaining = cursor['ids'][len(page_ids):]
+    intro = 'Here are the next {} events.'.format(len(page))
+    if not remaining:
+        return prepare_response(render_events(intro, page, ssml=SSML), ssml=SSML)
+    cursor = dict(cursor, ids=remaining)
+    return prepare_response(render_events(intro, page, ssml=SSML, outro=more_prompt(remaining)), ssml=SSML,
+                            session_attributes={'cursor': cursor}, end_session=False,
+                            reprompt=more_prompt(remaining).strip())
+
+
+def calendar_version(tenant=None):
+    """
+    :param {Tenant} tenant: (optional) the calendar; defaults to the default tenant's
+    :return: a value that changes whenever the events that questions are answered from change (i.e. the tenant's
+    event cache or snapshot)
+    """
+    tenant = tenant or default_tenant
+    snapshot = latest_snapshot(tenant)
+    return tenant.event_cache.version, snapshot and snapshot.created
+
+
+def latest_snapshot(tenant):
+    """
+    Gets a tenant's snapshot from memory. If it's time to check for a newer one, the check (and the download, if
+    there is one) runs in the background, so that the answer doesn't wait on S3; the newer snapshot is used from the
+    next request on.
+    :param {Tenant} tenant: the calendar
+    :return {Snapshot}: the latest snapshot loaded, or None if there isn't one (or the tenant doesn't take snapshots)
+    """
+    snapshots = tenant.snapshots
+    if snapshots is None:
+        return None
+    if snapshots.due():
+        refresher.refresh((tenant.name, 'snapshot'), snapshots.reload, lambda snapshot: None)
+    return snapshots.latest()
+
+
+def prepare_events_response(intro, events, start, end, labels=None, budget=None):
+    """
+    Generates a response that reads out a list of events. If PAGE_SIZE is set and there are more events than that,
+    only the first page is read, and a cursor for the rest (their IDs and the query they came from) is kept in the
+    session for handle_more_events_request. If the budget is nearly spent, only a few events are read.
+    :param {str} intro: the sentence to say before the events
+    :param {list} events: the events
+    :param {datetime} start: the first day the events were fetched for
+    :param {datetime} end: the last day the events were fetched for
+    :param {list} labels: (optional) the labels the events were filtered by
+    :param {Budget} budget: (optional) the time left to answer in
+    :return {dict}: a response to be sent back to AVS
+    """
+    max_events = budget.max_events() if budget else None
+    if not PAGE_SIZE or len(events) <= PAGE_SIZE:
+        return prepare_response(render_events(intro, events, ssml=SSML, max_events=max_events), ssml=SSML)
+    # Short of time, the first page is shortened rather than the rest being left out of the cursor
+    page_size = min(PAGE_SIZE, max_events or PAGE_SIZE)
+    remaining = [event.id for event in events[page_size:]]
+    cursor = {'start': format_date_url(start), 'end': format_date_url(end), 'labels': labels, 'ids': remaining}
+    return prepare_response(render_events(intro, events[:page_size], ssml=SSML, outro=more_prompt(remaining)),
+                            ssml=SSML, session_attributes={'cursor': cursor}, end_session=False,
+                            reprompt=more_prompt(remaining).strip())
+
+
+def more_prompt(remaining):
+    """Tells the user how to hear the next page of events."""
+    return ' Say "more" to hear the next {}.'.format(min(len(remaining), PAGE_SIZE))
 
 
 def prepare_abe_connectivity_problem_response():
@@ -123,68 +339,187 @@ def prepare_abe_connectivity_problem_response():
     return prepare_response('There was a problem speaking to ABE. Please contact your Library Overlord.')
 
 
-def get_events(start=None, end=None, labels=None):
+def get_events(start=None, end=None, labels=None, budget=None, tenant=None):
     """
     Makes any necessary HTTP requests and does any filtering necessary to get events from ABE.
     :param {datetime} start: (optional) the first day to fetch events for
     :param {datetime} end: (optional) the last day to fetch events for
+    :param {list} labels: (optional) a list of tags to filter results based on (or a single tag)
+    :param {Budget} budget: (optional) the time left to answer in
+    :param {Tenant} tenant: (optional) the calendar to get the events from; defaults to the default tenant's
+    :return {EventList}: the events found; its `stale` attribute is True if they came from an out-of-date cache entry,
+    and its `partial` attribute is True if there wasn't time to read them all from ABE
+    """
+    if isinstance(labels, str):
+        labels = [labels]  # Rather than a set of its letters
+    # Serve the range from memory if an earlier invocation already fetched it
+    if start and end:
+        return get_range_events(start, end, budget, labels=labels, tenant=tenant)
+    return fetch_events(start, end, budget, labels=labels, tenant=tenant)
+
+
+def get_events_concurrently(queries, budget=None, tenant=None):
+    """
+    Runs several get_events queries at once (e.g. for a compound question such as "this weekend's featured and
+    academic events"), so that the answer takes as long as the slowest query rather than all of them in turn.
+    :param {list} queries: dictionaries of get_events keyword arguments (start, end, labels)
+    :param {Budget} budget: (optional) the time left to answer in; all the queries must have finished by its parse
+    deadline
+    :param {Tenant} tenant: (optional) the calendar to get the events from; defaults to the default tenant's
+    :return {EventList}: the events found by the queries, without duplicates, in order of start time; or None if
+    none of the queries could be answered
+    """
+    tenant = tenant or default_tenant
+    return gather_events(queries, lambda query: get_events(budget=budget, tenant=tenant, **query),
+                         budget and budget.parse_deadline, max_workers=tenant.client.pool_size)
+
+
+def get_range_events(start, end, budget=None, labels=None, tenant=None):
+    """
+    Gets the events in a date range from the cache, falling back to ABE. A stale cached range is returned immediately
+    (and refreshed in the background) when SERVE_STALE is set, and is used as a fallback when ABE can't be reached
+    (or can't be read in time). Ranges covered by a recent enough snapshot are answered from that instead. Concurrent
+    misses for the same range share one fetch.
+    :param {datetime} start: the first day to fetch events for
+    :param {datetime} end: the last day to fetch events for
+    :param {Budget} budget: (optional) the time left to answer in
     :param {list} labels: (optional) a list of tags to filter results based on
-    :return {list}: the events found
+    :param {Tenant} tenant: (optional) the calendar to get the events from; defaults to the default tenant's
+    :return {EventList}: the events found, or None if there was an error talking to ABE and nothing was cached
+    """
+    tenant = tenant or default_tenant
+    event_cache = tenant.event_cache
+    range_start, range_end = format_date_url(start), format_date_url(end)
+    # The index is cut at local midnights; as 'YYYY-MM-DD' strings, the bounds would be UTC dates
+    first_day, end_day = parse_date(range_start), parse_date(range_end)
+    snapshot = latest_snapshot(tenant)
+    if snapshot and snapshot.covers(range_start, range_end) and time.time() - snapshot.created < SNAPSHOT_MAX_AGE:
+        with metrics.current().phase('filter'):
+            return EventList(snapshot.index.between(first_day, end_day, labels))
+    invocation = metrics.current()
+    with invocation.phase('filter'):  # Looking up the range and filtering it by label
+        cached = event_cache.get(range_start, range_end, labels, allow_stale=True)
+    # Counts rather than a ratio, so that CloudWatch can sum them over any period and work out the hit ratio
+    invocation.count('cache_misses' if cached is None else 'cache_stale_hits' if cached.stale else 'cache_hits')
+    if cached is not None and not cached.stale:
+        return cached
+
+    # Fetch a wide horizon rather than just the requested range, only asking
+    # ABE to filter by label if it knows how.
+    fetch_end = max(end, start + timedelta(days=PREFETCH_DAYS))
+    fetch_range_end = format_date_url(fetch_end)
+    fetch_labels = labels if LABEL_PUSHDOWN else None
+
+    if cached is not None and SERVE_STALE:
+        logger.info('Serving stale events between %s and %s', range_start, range_end)
+
+        def refresh():
+            events = fetch_events(start - ABE_DAY_MARGIN, fetch_end + ABE_DAY_MARGIN,
+                                  Budget(REFRESH_TIMEOUT, reserve=0), fetch_labels, timeout=REFRESH_TIMEOUT,
+                                  tenant=tenant)
+            return None if events is None or events.partial else events  # Only complete ranges are cached
+
+        refresher.refresh((tenant.name, range_start, fetch_range_end, fetch_labels and frozenset(fetch_labels)),
+                          refresh,
+                          lambda events: event_cache.put(range_start, fetch_range_end, events, fetch_labels))
+        return cached
+
+    def fetch():
+        events = fetch_events(start - ABE_DAY_MARGIN, fetch_end + ABE_DAY_MARGIN, budget, labels=fetch_labels,
+                              tenant=tenant)
+        if events is None or events.partial:  # Only complete ranges are cached
+            return events, None
+        return events, event_cache.put(range_start, fetch_range_end, events, fetch_labels)
+
+    # A caller that waits on another's fetch gives up when its own time to fetch is up
+    wait = None if budget is None or budget.parse_deadline is None else max(budget.remaining(budget.parse_deadline), 0)
+    events, index = fetches.do((tenant.name, range_start, fetch_range_end, fetch_labels and frozenset(fetch_labels)),
+                               fetch, timeout=wait) or (None, None)
+    if events is None or events.partial and cached is not None:
+        return cached  # Better out of date than nothing (or than only some of the events)
+    if events.partial:  # Not cached, as it's missing events
+        return EventList(EventIndex(events, tenant.event_class.to_zone).between(first_day, end_day, labels),
+                         partial=True)
+    return EventList(index.between(first_day, end_day, labels))
+
+
+def fetch_events(start=None, end=None, budget=None, labels=None, timeout=None, tenant=None):
     """
-    # [Not part of this goal] TODO replace by a logging command
-    print('Getting events between {} and {}'.format(start, end))
-    # Make an HTTP request to ABE
-    request_url = 'https://abe-dev.herokuapp.com/events/'  # TODO Load this from an environment variable
+    Makes the HTTP request to ABE for the events in a date range, bypassing the cache. The response is parsed as it
+    streams in, so only the events that pass the filters are ever held in memory.
+    :param {datetime} start: (optional) the first day to fetch events for
+    :param {datetime} end: (optional) the last day to fetch events for
+    :param {Budget} budget: (optional) the time left to answer in. ABE isn't asked at all if there's too little time
+    left; it must answer by the budget's fetch deadline (and never takes longer than `timeout` seconds); and the
+    response is only read until the budget's parse deadline.
+    :param {list} labels: (optional) a list of tags to filter results based on (which are also sent to ABE if
+    LABEL_PUSHDOWN is set)
+    :param {float} timeout: (optional) the most seconds to wait for ABE to answer; defaults to ABE_FETCH_TIMEOUT
+    :param {Tenant} tenant: (optional) the calendar to get the events from; defaults to the default tenant's
+    :return {EventList}: the events found, marked partial if the parse deadline passed (or reading failed) before they
+    had all been read; or None if there was an error talking to ABE before any were read
+    """
+    budget = budget or Budget()
+    tenant = tenant or default_tenant
+    if not budget.can_fetch():
+        logger.warning('Not enough time left to ask ABE for events between %s and %s', start, end)
+        return None
+    logger.info('Getting events between %s and %s', start, end)
     # It looks like this will do the wrong thing if one of start and end is defined and the other
     # is none, so add an assert for that, e.g.
     #    assert (start and end) or (not start and not end)
     # or the more cryptic:
     #    assert bool(start) == bool(end)
+    params = None
     if start and end:  # If we're searching within a specific range, add that to the GET parameters
-        request_url += '?start={}&end={}'.format(format_date_url(start), format_date_url(end))
+        params = {'start': format_date_url(start), 'end': format_date_url(end)}
+    if labels and LABEL_PUSHDOWN:
+        params = dict(params or {}, labels=','.join(sorted(labels)))
+    fetch_deadline = time.monotonic() + (FETCH_TIMEOUT if timeout is None else timeout)
+    if budget.fetch_deadline is not None:
+        fetch_deadline = min(budget.fetch_deadline, fetch_deadline)
 
-    # Put as little as possible inside a `try` block. In this case, just the
-    # call to `json.loads`.
+    # Make an HTTP request to ABE, converting each JSON item into an event object as it arrives
+    body = tenant.client.stream('/events/', params, deadline=fetch_deadline, read_deadline=budget.parse_deadline)
+    events = EventList()
     try:
-        with request.urlopen(request.Request(request_url)) as res:
-            # Parse the server response TODO Error checking
-            res = res.read().decode()
-            if res.startswith('[]'):  # TODO Why is this necessary????
-                print('Found 0 events')
-                return []  # No events found
-            print('Found some events:', res)
-            result = json.loads(res)
-    # Similarly, catch as narrow an exception as possible. As originally,
-    # written, this will catch network connection errors, server errors, and
-    # program errors in the block above, and disguise them all as parse errors.
-    except json.JSONDecodeError as e:
+        for event in iter_events(budget.cut_off(body), labels=labels, event_class=tenant.event_class):
+            events.append(event)  # Appended one by one so that the events read so far survive OutOfTime
+    except OutOfTime:
+        if not events:
+            logger.warning('Ran out of time before reading any events from ABE')
+            return None
+        logger.warning('Ran out of time reading events from ABE; answering with the %d read so far', len(events))
+        events.partial = True
+    except ABEError as e:
+        if not events:
+            logger.warning('Error connecting to ABE: %s', e)
+            return None  # Some error talking to ABE
+        # E.g. the body stalled until the parse deadline
+        logger.warning('Error reading events from ABE (%s); answering with the %d read so far', e, len(events))
+        events.partial = True
+    except ValueError as e:  # json.JSONDecodeError, without importing json on a cold start
         # Consider logging and then re-raising the error, so that the caller
         # receives this as an error instead of checking for None.
-        print('Error parsing response from ABE')
-        print(e)
+        logger.warning('Error parsing response from ABE: %s', e)
         return None  # Some error talking to ABE
+    finally:
+        body.close()  # Releases the connection if we stopped reading early
 
-    # Convert the result into the format we want
-    events = []
-    for item in result:
-        # Convert JSON into an event object
-        # Use a different variable for a different value type.
-        event = ABEEvent(item)
-        # Filter, if necessary TODO ABE does this
-        if labels:
-            if event.has_labels(labels):
-                events.append(event)
-        else:  # Filtering not necessary
-            events.append(event)
-    # Can also do something like:
-    #   events = [ABEEvent(event) for event in result]
-    #   if labels:
-    #       events = [event for event in events if event.has_labels(labels)]
-    # This is a matter of taste.
-
+    logger.info('Found %d events', len(events))
+    metrics.current().count('events_fetched', len(events))
     return events
 
 
+def local_now(tenant):
+    """
+    :param {Tenant} tenant: the calendar
+    :return {datetime}: the current time in the calendar's time zone (rather than the container's), naive like the
+    dates in AVS's slots
+    """
+    return datetime.now(tenant.event_class.to_zone).replace(tzinfo=None)
+
+
 def format_date_url(date, fmt='%Y-%m-%d'):
     """
     Formats a date as a string for making ABE requests.
@@ -195,18 +530,96 @@ def format_date_url(date, fmt='%Y-%m-%d'):
     return date.strftime(fmt)
 
 
-def prepare_response(text):
+def prepare_response(text, ssml=False, session_attributes=None, end_session=None, reprompt=None):
     """
     Generates a response object to be sent to AVS.
     :param text: the text for Alexa to speak
+    :param {boolean} ssml: True if the text is an SSML document rather than plain text
+    :param {dict} session_attributes: (optional) values for AVS to send back with the user's next request
+    :param {boolean} end_session: (optional) False to keep listening for a follow-up request
+    :param {str} reprompt: (optional) plain text for Alexa to speak if the user doesn't answer a follow-up question
     :return {dict}: the result to send back to AVS
     """
-    return {
+    response = {
         'version': '1.0',
         'response': {
-            'outputSpeech': {
+            'outputSpeech': {'type': 'SSML', 'ssml': text} if ssml else {
                 'type': 'PlainText',
                 'text': text,
             }
         }
     }
+    if reprompt is not None:
+        response['response']['reprompt'] = {'outputSpeech': {'type': 'PlainText', 'text': reprompt}}
+    if session_attributes is not None:
+        response['sessionAttributes'] = session_attributes
+    if end_session is not None:
+        response['response']['shouldEndSession'] = end_session
+    return response
+
+
+# Answers that never change are built once, when the module is loaded, and
+# don't touch ABE or the time zone database.
+dispatcher.static('LaunchRequest', prepare_response('Welcome to the ABE, the Olin calendar. How may I help you?'))
+dispatcher.static('AMAZON.HelpIntent', prepare_response(
+    "You can ask me what's happening next, what featured events are coming up, or what's happening on a particular "
+    'day. What would you like to know?', end_session=False, reprompt='What would you like to know?'))
+dispatcher.static(('AMAZON.StopIntent', 'AMAZON.CancelIntent'), prepare_response('Goodbye.', end_session=True))
+# Sent when the session ends other than by the skill's answer (the user said nothing, or there was an error). Alexa
+# doesn't speak the response to it, so it's empty.
+dispatcher.static('SessionEndedRequest', {'version': '1.0', 'response': {}})
+
+
+def snapshot_handler(event, context):
+    """
+    Entry function for the scheduled invocation (see serverless.yml) that saves a snapshot of each tenant's coming
+    events to its snapshot location (ABE_SNAPSHOT for the default tenant), so that lambda_handler can answer from it
+    rather than waiting on ABE. To run it locally, set ABE_SNAPSHOT to a directory and call
+    snapshot_handler(None, None). Without any snapshot locations, it does nothing.
+    :param event: the schedule event (unused)
+    :param context: the Lambda context object, which says how much time the invocation has left
+    :return {dict}: a summary of each tenant's snapshot, by tenant name (empty if none are configured)
+    """
+    snapshotted = [tenant for tenant in tenants if tenant.snapshots is not None]
+    if not snapshotted:  # Not an error, so that the schedule isn't retried (and alarmed on) where it's not set up
+        logger.info('No snapshot locations are configured (ABE_SNAPSHOT); not taking any snapshots')
+        return {}
+    budget = Budget.from_context(context, reserve=1)
+    summaries = {}
+    failed = []
+    for tenant in snapshotted:  # One tenant's ABE being down doesn't hold up the others' snapshots
+        start = local_now(tenant).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=PREFETCH_DAYS)
+        events = fetch_events(start - ABE_DAY_MARGIN, end + ABE_DAY_MARGIN, budget, timeout=REFRESH_TIMEOUT,
+                              tenant=tenant)
+        if events is None or events.partial:
+            logger.warning('Could not get the events between %s and %s for %s', start, end, tenant.name)
+            failed.append(tenant.name)
+            continue
+        size = tenant.snapshots.save(events, format_date_url(start), format_date_url(end))
+        logger.info('Saved a snapshot of %d events (%d bytes) for %s', len(events), size, tenant.name)
+        summaries[tenant.name] = {'start': format_date_url(start), 'end': format_date_url(end), 'events': len(events),
+                                  'bytes': size}
+    if failed:
+        raise ABEError('Could not get the events for {} from ABE'.format(', '.join(failed)))
+    return summaries
+
+
+def warm_up(budget=None):
+    """
+    Does the work that would otherwise slow down the first invocation of a new container: loads the latest snapshots,
+    opens a (TLS) connection to ABE, loads the coming events into the cache and resolves the local time zone.
+    :param {Budget} budget: (optional) the time to spend warming up
+    """
+    for tenant in tenants:
+        if tenant.snapshots is not None:
+            tenant.snapshots.reload()
+        today = local_now(tenant)
+        events = get_events(start=today, end=today + timedelta(weeks=1), budget=budget, tenant=tenant)
+        if events:
+            events[0].get_start_speech()
+
+
+if WARMUP:
+    warm_up(Budget(WARMUP_TIMEOUT, reserve=0))
+
@@ -7,5 +7,17 @@ but this package isn't self-evident.
 It looks like it's a proxy, or client, to the remote ABE service?
 """
 
+from . import metrics
+from .abe_client import ABEClient, ABEError
 from .abe_event import ABEEvent
+from .async_query import gather_events
 from .avs_intent import AVSIntent
+from .background_refresh import BackgroundRefresher
+from .budget import Budget, OutOfTime
+from .dispatch import Dispatcher
+from .event_cache import EventCache, EventList
+from .event_index import EventIndex
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .snapshot import Snapshots, open_store
+from .tenants import Tenant, Tenants
@@ -0,0 +1,295 @@
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from . import metrics
+
+
+class ABEError(Exception):
+    """Raised when ABE can't be reached, or doesn't answer successfully before the deadline."""
+
+
+class ABEStatusError(ABEError):
+    """Raised when ABE responds with an HTTP error status."""
+
+    def __init__(self, status, reason):
+        super().__init__('ABE responded {} {}'.format(status, reason))
+        self.status = status
+
+
+class _StaleConnection(ABEError):
+    """Raised when a pooled connection turns out to have been closed by the server while it was idle."""
+
+
+class ABEClient:
+    """
+    ABEClient makes HTTP requests to ABE over a small pool of persistent (keep-alive) connections.
+
+    Keep one client per container (e.g. in a module-level variable) so that warm invocations reuse the connections
+    instead of paying for a new TLS handshake each time. Responses are requested gzip-compressed, and gzipped bodies
+    are remembered along with their ETag/Last-Modified validators so that repeated requests can be answered by a
+    304 Not Modified instead of a full payload. The remembered bodies are bounded in total size, and large (or
+    uncompressed) ones aren't kept at all, so that they don't crowd out the parsed events on a small Lambda.
+    """
+
+    def __init__(self, base_url, pool_size=4, max_retries=2, backoff=0.1, connect_timeout=1.0,
+                 max_validator_bytes=1 << 20, max_validator_body=256 << 10, max_idle=30):
+        """
+        :param {str} base_url: ABE's root URL, e.g. 'https://abe-dev.herokuapp.com'
+        :param {int} pool_size: the most idle connections to keep open
+        :param {int} max_retries: the number of times to retry a failed request (if the deadline allows)
+        :param {float} backoff: the base number of seconds to wait between retries
+        :param {float} connect_timeout: the most seconds to spend opening a connection
+        :param {int} max_validator_bytes: the most bytes of bodies to remember for conditional requests
+        :param {int} max_validator_body: bodies bigger than this many bytes (as sent) aren't remembered
+        :param {float} max_idle: the most seconds to keep a connection idle in the pool; servers (e.g. Heroku's router)
+        close idle keep-alive connections, so older ones are likely to be dead
+        """
+        # Split by hand rather than with urllib.parse, which is slow to import on a cold start
+        self.scheme, _, rest = base_url.partition('://')
+        self.host, slash, path = rest.partition('/')
+        self.base_path = (slash + path).rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.connect_timeout = connect_timeout
+        self.max_validator_bytes = max_validator_bytes
+        self.max_validator_body = max_validator_body
+        self.max_idle = max_idle
+        self._idle = []  # (connection, time.monotonic() when it was released), most recently released last
+        self._validators = OrderedDict()  # path -> (etag, last modified, content encoding, raw body), LRU first
+        self._validator_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, params=None, deadline=None):
+        """
+        Makes a GET request to ABE, retrying with jittered backoff on connection errors and server errors.
+        :param {str} path: the path below the base URL, e.g. '/events/'
+        :param {dict} params: (optional) the query string parameters
+        :param {float} deadline: (optional) the time.monotonic() by which the response must have been read
+        :return {bytes}: the (decompressed) response body
+        """
+        return b''.join(self.stream(path, params, deadline))
+
+    def stream(self, path, params=None, deadline=None, chunk_size=16384, read_deadline=None):
+        """
+        Makes a GET request to ABE like get, but yields the (decompressed) body in chunks as it arrives. If the caller
+        stops reading early, the connection is closed instead of being returned to the pool.
+        :param {str} path: the path below the base URL, e.g. '/events/'
+        :param {dict} params: (optional) the query string parameters
+        :param {float} deadline: (optional) the time.monotonic() by which the response must have been received
+        :param {int} chunk_size: the most bytes to read from the connection at a time
+        :param {float} read_deadline: (optional) the time.monotonic() by which the body must have been read. Each read
+        only waits for as long as is left before it, so a server that stalls mid-body can't hold up the caller past it.
+        :return {generator}: the chunks of the response body, as bytes
+        :raise {ABEError}: if the request fails, or the body can't be read (e.g. by the read deadline)
+        """
+        if params:
+            from urllib.parse import urlencode
+            path += '?' + urlencode(params)
+        connection, response, validator = self._open(path, deadline)
+        if response is None:  # Not modified since we last saw it
+            yield from _decompress([validator[3]], validator[2])
+            return
+
+        encoding = response.getheader('Content-Encoding')
+        etag, last_modified = response.getheader('ETag'), response.getheader('Last-Modified')
+        # The body is kept as it came over the wire, but only if it's gzipped (and so much smaller than the decoded
+        # JSON) and not too big
+        raw = [] if (etag or last_modified) and encoding == 'gzip' else None
+        complete = False
+        invocation = metrics.current()
+        read = response.read if read_deadline is None else _bounded_read(connection, response, read_deadline)
+        try:
+            if invocation.enabled:
+                chunks = iter(lambda: _timed_read(read, chunk_size, invocation), b'')
+            else:
+                chunks = iter(lambda: read(chunk_size), b'')
+            if raw is not None:
+                chunks = _tee(chunks, raw, self.max_validator_body)
+            yield from _decompress(chunks, encoding)
+            complete = True
+        except (OSError, _http_client().HTTPException, zlib.error) as e:
+            raise ABEError('GET {} failed while reading: {}'.format(path, e)) from e
+        finally:
+            if complete and not response.will_close:
+                self._release(connection)
+            else:
+                connection.close()
+        if raw and raw[-1] is not None:  # Kept in full
+            self._remember(path, (etag, last_modified, encoding, b''.join(raw)))
+
+    def _remember(self, path, validator):
+        with self._lock:
+            old = self._validators.pop(path, None)
+            if old is not None:
+                self._validator_bytes -= len(old[3])
+            self._validators[path] = validator
+            self._validator_bytes += len(validator[3])
+            while self._validator_bytes > self.max_validator_bytes:
+                _, evicted = self._validators.popitem(last=False)
+                self._validator_bytes -= len(evicted[3])
+
+    def close(self):
+        """Closes the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def _open(self, path, deadline):
+        """Sends the request (with retries) and returns (connection, response, validator) once the headers are in."""
+        attempt = 0
+        while True:
+            try:
+                return self._send(path, deadline)
+            except ABEStatusError as e:
+                if e.status < 500:
+                    raise  # Client errors won't be fixed by retrying
+                error = e
+            except _StaleConnection:
+                # The server closed it while it was idle, and likely the rest of the pool with it. That isn't a
+                # failure of ABE's, so retry right away on a new connection, without using up a retry.
+                metrics.current().count('abe_stale_connections')
+                self.close()
+                continue
+            except (OSError, _http_client().HTTPException, ABEError) as e:
+                error = e
+            delay = self.backoff * (2 ** attempt) * random.random()  # "Full jitter"
+            attempt += 1
+            if attempt > self.max_retries or _remaining(deadline) <= delay:
+                raise ABEError('GET {} failed: {}'.format(path, error)) from error
+            time.sleep(delay)
+
+    def _send(self, path, deadline):
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            raise ABEError('deadline passed')
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        with self._lock:
+            validator = self._validators.get(path)
+        if validator:
+            etag, last_modified, _, _ = validator
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        connection, reused = self._acquire(remaining)
+        try:
+            if connection.sock is None:  # The server closed the connection while it was idle
+                connection.connect()
+            connection.sock.settimeout(None if deadline is None else remaining)
+            with metrics.current().phase('abe_ttfb'):
+                connection.request('GET', self.base_path + path, headers=headers)
+                response = connection.getresponse()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:  # Incl. RemoteDisconnected
+            connection.close()
+            if reused:  # Closed before it sent anything back, so nothing was lost by sending the request
+                raise _StaleConnection(str(e)) from e
+            raise
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.status == 200:
+            return connection, response, None
+        response.read()  # Finish the response so that the connection can be reused
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        if response.status == 304 and validator:
+            with self._lock:
+                self._validators.move_to_end(path)
+            return None, None, validator
+        raise ABEStatusError(response.status, response.reason)
+
+    def _acquire(self, remaining):
+        """Returns (connection, True) for a pooled connection, or (connection, False) for a new one."""
+        oldest = time.monotonic() - self.max_idle
+        with self._lock:
+            expired = [connection for connection, released in self._idle if released < oldest]
+            self._idle = [(connection, released) for connection, released in self._idle if released >= oldest]
+            pooled = self._idle.pop()[0] if self._idle else None
+        for connection in expired:
+            connection.close()
+        if pooled is not None:
+            return pooled, True
+        http_client = _http_client()
+        connection_class = http_client.HTTPSConnection if self.scheme == 'https' else http_client.HTTPConnection
+        connection = connection_class(self.host, timeout=min(self.connect_timeout, remaining))
+        invocation = metrics.current()
+        with invocation.phase('abe_connect'):
+            connection.connect()
+        invocation.count('abe_connections')
+        return connection, False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+
+def _http_client():
+    # http.client (and the ssl and email modules it pulls in) is a good part of a cold start, and isn't needed until
+    # the first request
+    import http.client
+    return http.client
+
+
+def _bounded_read(connection, response, read_deadline):
+    """Returns a read function whose every call gives up at the read deadline."""
+    def read(size):
+        remaining = read_deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError('read deadline passed')
+        connection.sock.settimeout(remaining)
+        # read1 makes at most one read from the socket (where read would wait for the whole size), so the timeout
+        # bounds the call
+        return response.read1(size)
+    return read
+
+
+def _timed_read(read, size, invocation):
+    began = time.perf_counter()
+    chunk = read(size)
+    invocation.add_time('abe_download', time.perf_counter() - began)
+    invocation.count('payload_bytes', len(chunk), unit='Bytes')
+    return chunk
+
+
+def _tee(chunks, saved, limit):
+    """Yields the chunks, copying them to saved unless they come to more than limit bytes (then saved is [None])."""
+    size = 0
+    for chunk in chunks:
+        if saved[-1:] != [None]:
+            size += len(chunk)
+            if size <= limit:
+                saved.append(chunk)
+            else:
+                saved[:] = [None]  # Too big to keep
+        yield chunk
+
+
+def _decompress(chunks, encoding):
+    if encoding != 'gzip':
+        yield from chunks
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def _remaining(deadline):
+    return float('inf') if deadline is None else deadline - time.monotonic()
+
@@ -1,6 +1,6 @@
-from datetime import datetime
+from .timezones import UTC, LazyZone, localize_timestamp, localize_timestamps
 
-from dateutil import tz
+_zone_classes = {}  # Time zone name -> ABEEvent subclass, for ABEEvent.in_zone
 
 
 class ABEEvent:
@@ -12,18 +12,110 @@ class ABEEvent:
     documentation or a test case that contains examples).
     """
 
-    from_zone = tz.gettz('UTC')
+    # Events are created by the hundred for every ABE response, so keep them small: no per-instance __dict__, and
+    # start/end are only parsed (and converted to local time) the first time they're read.
+    __slots__ = ('id', 'title', 'start_key', 'end_key', 'location', 'all_day', 'labels', '_start', '_end')
+
+    from_zone = UTC
     # Because the app is in this time zone, or the user is in this time zone?
     # Consider using an environment variable.
-    to_zone = tz.gettz('America/New_York')
+    # Resolved on first use, so that loading the tz database isn't part of every cold start.
+    to_zone_name = 'America/New_York'
+    to_zone = LazyZone(to_zone_name)
 
     def __init__(self, dict_data):
-        self.title = dict_data['title']
-        self.start = self._parse_date_time(dict_data.get('start'))
-        self.end = self._parse_date_time(dict_data.get('end'))
-        self.location = dict_data.get('location')
-        self.all_day = dict_data.get('allDay')
-        self.labels = dict_data.get('labels')
+        self._set_fields(dict_data.get('id'), dict_data['title'], dict_data.get('start'), dict_data.get('end'),
+                         dict_data.get('location'), dict_data.get('allDay'), frozenset(dict_data.get('labels') or ()))
+
+    def _set_fields(self, event_id, title, start_key, end_key, location, all_day, labels, start=None, end=None):
+        """
+        Sets every field of the event; __init__, from_fields (and so from_list and the snapshot loader) all come
+        through here, so a new slot is only assigned in one place.
+        """
+        self.id = event_id
+        self.title = title
+        # ABE's UTC timestamps ('YYYY-MM-DD HH:MM:SS'), which sort in chronological order without parsing
+        self.start_key = start_key
+        self.end_key = end_key
+        self.location = location
+        self.all_day = all_day
+        self.labels = labels
+        # Local times, parsed from the keys on first read unless they're already known
+        self._start = start
+        self._end = end
+
+    @classmethod
+    def from_fields(cls, event_id, title, start_key, end_key=None, location=None, all_day=None, labels=frozenset(),
+                    start=None, end=None):
+        """
+        Makes an event from values that have already been extracted (e.g. from a snapshot), rather than from ABE's
+        JSON.
+        :param {str} event_id: the ABE ID
+        :param {str} title: the title
+        :param {str} start_key: the UTC start timestamp ('YYYY-MM-DD HH:MM:SS')
+        :param {str} end_key: (optional) the UTC end timestamp
+        :param {str} location: (optional) where the event is
+        :param {boolean} all_day: (optional) True for an all-day event
+        :param {frozenset} labels: (optional) the event's labels
+        :param {datetime} start: (optional) the start time already converted to local time
+        :param {datetime} end: (optional) the end time already converted to local time
+        :return {ABEEvent}: the event
+        """
+        event = cls.__new__(cls)
+        event._set_fields(event_id, title, start_key, end_key, location, all_day, labels, start, end)
+        return event
+
+    @classmethod
+    def in_zone(cls, name):
+        """
+        Gets a subclass of ABEEvent whose times are converted to another time zone, for calendars outside
+        ABEEvent.to_zone.
+        :param {str} name: the time zone's IANA name, e.g. 'America/Chicago'
+        :return {type}: the subclass (the same one for every call with the same name)
+        """
+        if name == cls.to_zone_name:
+            return cls
+        subclass = _zone_classes.get(name)
+        if subclass is None:
+            subclass = _zone_classes[name] = type('ABEEvent', (cls,), {
+                '__slots__': (), 'to_zone': LazyZone(name), 'to_zone_name': name})
+        return subclass
+
+    @classmethod
+    def from_list(cls, items):
+        """
+        Converts a whole ABE result list into events in one pass.
+        :param {list} items: the JSON objects received from ABE
+        :return {list}: the events
+        """
+        return [cls(item) for item in items]
+
+    @classmethod
+    def localize(cls, events):
+        """
+        Converts the start and end times of many events to local time at once (e.g. before writing a snapshot, or
+        speaking a long list), rather than one at a time as each is first read. Timestamps shared by several events
+        are only converted once.
+        :param {list} events: the events
+        """
+        events = [event for event in events if event._start is None or event._end is None]
+        starts = localize_timestamps([event.start_key for event in events], cls.to_zone)
+        ends = localize_timestamps([event.end_key for event in events], cls.to_zone)
+        for event, start, end in zip(events, starts, ends):
+            event._start = start
+            event._end = end
+
+    @property
+    def start(self):
+        if self._start is None:
+            self._start = self._parse_date_time(self.start_key)
+        return self._start
+
+    @property
+    def end(self):
+        if self._end is None:
+            self._end = self._parse_date_time(self.end_key)
+        return self._end
 
     def get_start_speech(self):
         # Isn't str(strftime(…)) redundant?
@@ -36,25 +128,14 @@ class ABEEvent:
         :param {boolean} exact_match: if True, the event must contain all of the specified labels, otherwise a single match is adequate
         :return {boolean}: True if the event has the given labels, False otherwise
         """
-        for target_label in labels:  # For each of the filter labels
-            if target_label in self.labels:  # See if the event has it
-                if not exact_match:  # If we're just looking for a partial match
-                    return True  # We have successfully done a partial match
-            elif exact_match:  # If the label is not on the event, check if we need an exact match
-                return False  # Exact match failed
-
-        # Can also probably something like the following. Again, this is a
-        # matter of taste.
-        #   if exact_match:
-        #       return set(self.labels) == set(labels)
-        #   else:
-        #       return not set(self.labels).isdisjoin(set(labels))
-
-        return True  # Exact match successful
-
-    @staticmethod
-    def _parse_date_time(string):
-        dt = datetime.strptime(string, '%Y-%m-%d %H:%M:%S')
-        # Convert from UTC to Eastern
-        dt.replace(tzinfo=ABEEvent.from_zone)
-        return dt.astimezone(ABEEvent.to_zone)
+        if not labels:
+            return True
+        if exact_match:
+            return self.labels.issuperset(labels)
+        return not self.labels.isdisjoint(labels)
+
+    @classmethod
+    def _parse_date_time(cls, string):
+        # Convert from UTC (ABEEvent.from_zone) to Eastern (or the subclass's zone), by way of a table of the year's
+        # DST transitions
+        return localize_timestamp(string, cls.to_zone)
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+
+from .event_cache import EventList
+
+# Shared by every fan-out in the container, one per size, so that each tenant's fan-outs run on as many threads as its
+# ABE client has pooled connections
+_executors = {}  # max_workers -> ThreadPoolExecutor
+_executors_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _get_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = _executors[max_workers] = ThreadPoolExecutor(max_workers=max_workers,
+                                                                    thread_name_prefix='abe-query')
+        return executor
+
+
+def gather_events(queries, fetch, deadline=None, max_workers=4):
+    """
+    Runs several event queries concurrently on an asyncio event loop, then merges their results.
+
+    The fetches themselves are blocking (they go through the pooled ABE client), so each one runs on a shared thread
+    pool while the event loop waits for all of them under one deadline. Queries that haven't finished by the
+    deadline, or that fail, are left out of the result.
+    :param {list} queries: the queries; each is passed to fetch as is
+    :param {function} fetch: called with a query; returns an EventList, or None on failure
+    :param {float} deadline: (optional) the time.monotonic() by which all the queries must have finished
+    :param {int} max_workers: the most queries to run at once
+    :return {EventList}: the events found by any of the queries, without duplicates, in order of start time; or
+    None if none of the queries succeeded
+    """
+    if not queries:
+        return EventList()
+    import asyncio  # Only compound queries need it, so keep it out of the cold start
+    loop = asyncio.new_event_loop()  # Rather than asyncio.run, which needs Python 3.7
+    try:
+        results = loop.run_until_complete(_gather(loop, queries, fetch, deadline, _get_executor(max_workers)))
+    finally:
+        loop.close()
+    results = [result for result in results if result is not None]
+    if not results:
+        return None
+    return merge_events(results)
+
+
+async def _gather(loop, queries, fetch, deadline, executor):
+    import asyncio
+    futures = [loop.run_in_executor(executor, fetch, query) for query in queries]
+    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+    done, pending = await asyncio.wait(futures, timeout=timeout)
+    for future in pending:
+        future.cancel()  # The thread carries on, but nobody waits for it
+    results = []
+    for query, future in zip(queries, futures):
+        error = future.exception() if future in done else None
+        if error is not None:
+            logger.warning('Error fetching %r: %s', query, error, exc_info=error)
+        results.append(future.result() if future in done and error is None else None)
+    return results
+
+
+def merge_events(event_lists):
+    """
+    Merges several lists of events, dropping duplicates (by ABE ID).
+    :param {list} event_lists: the lists of events
+    :return {EventList}: the events, in order of start time; stale (or partial) if any of the lists was
+    """
+    events = []
+    seen = set()
+    for event_list in event_lists:
+        for event in event_list:
+            key = event.id or id(event)
+            if key not in seen:
+                seen.add(key)
+                events.append(event)
+    events.sort(key=lambda event: event.start_key)
+    return EventList(events, stale=any(getattr(event_list, 'stale', False) for event_list in event_lists),
+                     partial=any(getattr(event_list, 'partial', False) for event_list in event_lists))
@@ -1,27 +1,58 @@
+from collections.abc import Mapping
+
+
 class AVSIntent:
     """
     This class stores information associated with an Alexa Voice Service intent.
     """
 
+    __slots__ = ('session_attributes', 'request_type', 'is_launch_request', 'name', 'slots')
+
     def __init__(self, server_response):  # TODO Error handling
-        event_type = server_response['request']['type']
+        event_type = self.request_type = server_response['request']['type']
+
+        # Values that the skill asked AVS to hold on to between turns of the conversation
+        session = server_response.get('session') or {}
+        self.session_attributes = session.get('attributes') or {}
 
         # Check if the user said "Alexa, open Bear" (or the like)
         self.is_launch_request = event_type == 'LaunchRequest'
 
-        if not self.is_launch_request:  # The user said something more than "open Bear"
+        if event_type == 'IntentRequest':  # The user said something more than "open Bear"
             intent = server_response['request']['intent']
             self.name = intent['name']
-            self.slots = {}
-            if 'slots' in intent:
-                for name, slot in intent['slots'].items():
-                    self.slots[name] = IntentSlot(slot)
-        else:  # No intent libeary if Skill was simply opened
+            self.slots = IntentSlots(intent.get('slots') or {})
+        else:  # No intent libeary if Skill was simply opened (or the session ended, etc.)
             # Define member variables
             self.name = None
             self.slots = None
 
 
+class IntentSlots(Mapping):
+    """
+    The slots of an intent, by name. The IntentSlot for a slot is only made when the slot is first looked up, so
+    slots that the handler doesn't use cost nothing.
+    """
+
+    __slots__ = ('_data', '_slots')
+
+    def __init__(self, data):
+        self._data = data
+        self._slots = {}
+
+    def __getitem__(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slots[name] = IntentSlot(self._data[name])
+        return slot
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
 class IntentSlot:
     """
     Intent slots are used by AVS to attach extra information to a request. For example, if one said, "Alexa, ask Bear
@@ -29,6 +60,8 @@ class IntentSlot:
     "tomorrow" would be turned into a date object and attached to a slot in the intent.
     """
 
+    __slots__ = ('name', 'value', 'confirmation_status')
+
     def __init__(self, server_data):
         self.name = server_data.get('name')
         self.value = server_data.get('value')
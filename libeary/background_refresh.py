@@ -0,0 +1,44 @@
+import threading
+
+
+class BackgroundRefresher:
+    """
+    BackgroundRefresher runs slow fetches on daemon threads, so that a handler can answer from stale data and let the
+    refreshed data land in the cache for the next invocation.
+
+    Only one refresh per key runs at a time. Note that Lambda freezes a container between invocations, so a refresh
+    that hasn't finished when the handler returns resumes when the container is next thawed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = set()
+
+    def is_refreshing(self, key):
+        with self._lock:
+            return key in self._in_flight
+
+    def refresh(self, key, fetch, on_result):
+        """
+        Starts a background fetch, unless one for the same key is already running.
+        :param key: identifies what's being fetched
+        :param {function} fetch: called with no arguments; returns the new value, or None on failure
+        :param {function} on_result: called with the new value if the fetch succeeded
+        :return {boolean}: True if a new refresh was started
+        """
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+
+        def run():
+            try:
+                result = fetch()
+                if result is not None:
+                    on_result(result)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+        threading.Thread(target=run, name='abe-refresh', daemon=True).start()
+        return True
@@ -0,0 +1,83 @@
+import time
+
+
+class OutOfTime(Exception):
+    """Raised when a stage of answering a request runs past its share of the invocation's time."""
+
+
+class Budget:
+    """
+    Budget divides the time left in a Lambda invocation between the stages of answering a request: waiting on ABE
+    (connecting and the response headers), reading and parsing the events as they stream in, and rendering the
+    speech. A little is kept back in reserve so that the response is sent before Lambda's timeout.
+
+    Each stage checks its own deadline and degrades instead of failing: a request that can't reach ABE in time is
+    answered from the cache, a response that can't be read in time is answered with the events read so far, and an
+    answer that has to be rendered in a hurry speaks fewer events.
+
+    A budget made without a time limit (e.g. when running locally, with no Lambda context) never runs out.
+    """
+
+    def __init__(self, seconds=None, reserve=0.25, fetch_share=0.5, parse_share=0.35, min_fetch=0.1,
+                 min_render=0.05, short_answer=3, clock=time.monotonic):
+        """
+        :param {float} seconds: (optional) the time left in the invocation
+        :param {float} reserve: the number of seconds to keep back for sending the response
+        :param {float} fetch_share: the fraction of the rest that ABE has to answer in
+        :param {float} parse_share: the fraction of the rest for reading and parsing the response
+        :param {float} min_fetch: don't ask ABE at all if there are fewer than this many seconds left to fetch in
+        :param {float} min_render: speak a short answer if there are fewer than this many seconds left to render in
+        :param {int} short_answer: the number of events in a short answer
+        :param {function} clock: returns the current time in seconds (swappable for tests)
+        """
+        self.min_fetch = min_fetch
+        self.min_render = min_render
+        self.short_answer = short_answer
+        self.clock = clock
+        if seconds is None:
+            self.fetch_deadline = self.parse_deadline = self.deadline = None
+            return
+        now = clock()
+        usable = max(seconds - reserve, 0)
+        self.fetch_deadline = now + usable * fetch_share
+        self.parse_deadline = self.fetch_deadline + usable * parse_share
+        self.deadline = now + usable  # Rendering gets whatever the other stages leave
+
+    @classmethod
+    def from_context(cls, context, **kwargs):
+        """
+        Makes a budget for the time left in a Lambda invocation.
+        :param context: the Lambda context object (or None when running locally)
+        :return {Budget}: the budget; unlimited if the context doesn't say how much time is left
+        """
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return cls(**kwargs)
+        return cls(context.get_remaining_time_in_millis() / 1000, **kwargs)
+
+    def remaining(self, deadline=None):
+        """
+        :param {float} deadline: (optional) one of this budget's deadlines; defaults to the overall deadline
+        :return {float}: the number of seconds until the deadline (infinite for an unlimited budget)
+        """
+        deadline = self.deadline if deadline is None else deadline
+        return float('inf') if deadline is None else deadline - self.clock()
+
+    def can_fetch(self):
+        """:return {boolean}: True if there's enough time left to be worth asking ABE"""
+        return self.fetch_deadline is None or self.remaining(self.fetch_deadline) >= self.min_fetch
+
+    def max_events(self):
+        """:return {int}: the most events to speak, or None if there's time to speak them all"""
+        return self.short_answer if self.remaining() < self.min_render else None
+
+    def cut_off(self, chunks):
+        """
+        Passes a response body through until the parse deadline.
+        :param {iterable} chunks: the response body, as a sequence of bytes
+        :return {generator}: the same chunks
+        :raise {OutOfTime}: when the parse deadline passes before the body has been read
+        """
+        for chunk in chunks:
+            if self.parse_deadline is not None and self.clock() > self.parse_deadline:
+                raise OutOfTime('ran out of time reading the response')
+            yield chunk
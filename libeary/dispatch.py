@@ -0,0 +1,71 @@
+class Dispatcher:
+    """
+    Dispatcher maps intent names to the functions that answer them, so that picking a handler is a dict lookup rather
+    than a chain of comparisons.
+
+    A handler is called with the AVSIntent and the keyword arguments given to dispatch (e.g. the request's Budget),
+    and returns the response to send to AVS. Intents whose answer never changes (help, stop, etc.) can instead be
+    given a static response, which is built once and returned as is; it must not be modified.
+
+    Requests other than intents are dispatched under their request type: e.g. 'LaunchRequest' (the user opening the
+    skill without asking anything), or 'SessionEndedRequest' (a session that was left open, e.g. to hear more events,
+    timing out).
+    """
+
+    def __init__(self, fallback=None):
+        """
+        :param {function} fallback: (optional) the handler for intents with no handler of their own; by default they
+        raise a KeyError
+        """
+        self.fallback = fallback
+        self._handlers = {}
+
+    def add(self, names, handler):
+        """
+        Registers a handler for one or more intents.
+        :param names: an intent name, or a list of them
+        :param {function} handler: called with the intent and dispatch's keyword arguments; returns the response
+        """
+        for name in [names] if isinstance(names, str) else names:
+            self._handlers[name] = handler
+
+    def handler(self, *names):
+        """A decorator that registers the decorated function as the handler for the named intents."""
+        def register(function):
+            self.add(names, function)
+            return function
+        return register
+
+    def static(self, names, response):
+        """
+        Answers one or more intents with a prebuilt response.
+        :param names: an intent name, or a list of them
+        :param {dict} response: the response to send back to AVS
+        """
+        self.add(names, lambda intent, **kwargs: response)
+
+    def dispatch(self, intent, **kwargs):
+        """
+        Answers an intent with the handler registered for it.
+        :param {AVSIntent} intent: the intent from AVS
+        :param kwargs: passed on to the handler, e.g. budget (the time left to answer in)
+        :return {dict}: the response to send back to AVS
+        """
+        name = self.name_of(intent)
+        handler = self._handlers.get(name, self.fallback)
+        if handler is None:
+            raise KeyError('no handler for {!r}'.format(name))
+        return handler(intent, **kwargs)
+
+    @staticmethod
+    def name_of(intent):
+        """
+        :param {AVSIntent} intent: the intent from AVS
+        :return {str}: the name its handler is registered under: the intent's name, or the type of a request that
+        isn't an intent
+        """
+        return intent.name if intent.request_type == 'IntentRequest' else intent.request_type
+
+    def __contains__(self, name):
+        return name in self._handlers
+
@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .abe_event import ABEEvent
+from .event_index import EventIndex
+from .timezones import parse_date
+
+
+class EventCache:
+    """
+    EventCache keeps events fetched from ABE in memory between warm invocations of the Lambda container.
+
+    Entries are keyed by the range of local days they hold the events of (as 'YYYY-MM-DD' strings). A query is
+    answered from memory when the live ranges together cover it, so a request for tomorrow is served by an earlier
+    request for the whole week. Ranges are treated as half-open: [start, end). An entry may also hold events from
+    either side of its range (ABE's ranges are UTC days, so a range of local days is fetched with some to spare);
+    queries are cut from local midnight to local midnight, never by ABE's UTC dates. Each range's events are kept in an
+    EventIndex, so answering a query for part of a range is a bisect lookup, and filtering it by label is a bitset
+    operation. A range fetched with a label filter pushed down to ABE is kept separately, and only answers queries
+    for the same labels.
+
+    The cache is bounded by the total number of events it holds; the least recently used ranges are evicted first.
+    Ranges that have outlived their TTL are kept for another max_stale seconds, so that callers can still serve them
+    (marked as stale) while ABE is slow or unreachable.
+    """
+
+    def __init__(self, ttl=300, max_events=5000, max_stale=86400, event_class=ABEEvent, clock=time.monotonic):
+        """
+        :param {int} ttl: the default number of seconds a fetched range stays fresh
+        :param {int} max_events: the most events to keep in memory across all ranges
+        :param {int} max_stale: the number of seconds past its TTL that a range can still be served as stale
+        :param {type} event_class: the class of the events, whose time zone (to_zone) the days are local to
+        :param {function} clock: returns the current time in seconds (swappable for tests)
+        """
+        self.event_class = event_class
+        self.ttl = ttl
+        self.max_events = max_events
+        self.max_stale = max_stale
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.version = 0  # Incremented whenever the cached events change, for caches of answers built from them
+        self._ranges = OrderedDict()  # (start, end, labels) -> _CachedRange, least recently used first
+        self._size = 0
+        self._lock = threading.RLock()  # Background refreshes and concurrent queries share the cache
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def hit_ratio(self):
+        served = self.hits + self.stale_hits
+        lookups = served + self.misses
+        return served / lookups if lookups else 0.0
+
+    def get(self, start, end, labels=None, allow_stale=False):
+        """
+        Looks up the events starting within a date range.
+        :param {str} start: the first day of the range ('YYYY-MM-DD')
+        :param {str} end: the day after the last day of the range ('YYYY-MM-DD')
+        :param {list} labels: (optional) only return events with at least one of these labels
+        :param {boolean} allow_stale: if True, ranges past their TTL (but within max_stale) can answer the query
+        :return {EventList}: the cached events, or None if the range isn't fully covered by usable entries
+        """
+        with self._lock:
+            labels = _labels_key(labels)
+            now = self.clock()
+            # Fresh entries are always preferred; stale ones only fill in when nothing fresh covers the range
+            oldest = now - self.max_stale if allow_stale else now
+            for min_expiry in sorted({now, oldest}, reverse=True):
+                for key in ((start, end, labels), (start, end, None)):
+                    exact = self._ranges.get(key)
+                    if exact is not None and exact.expires > min_expiry:
+                        self._ranges.move_to_end(key)
+                        return self._hit(exact.index.between(parse_date(start), parse_date(end), labels), [exact], now)
+
+                covering = self._find_covering(start, end, labels, min_expiry)
+                if covering is not None:
+                    return self._hit(self._merge(covering, start, end, labels), covering, now)
+
+            self.misses += 1
+            return None
+
+    def find(self, start, end, event_ids, labels=None):
+        """
+        Looks up events by ID in the ranges (fresh or stale) that cover a date range, e.g. to carry on reading out a
+        list of events that was fetched on an earlier turn.
+        :param {str} start: the first day of the range ('YYYY-MM-DD')
+        :param {str} end: the day after the last day of the range ('YYYY-MM-DD')
+        :param {list} event_ids: the ABE IDs of the events
+        :param {list} labels: (optional) the labels the events were queried by
+        :return {list}: the events that are still cached, in the order of event_ids; or None if the range isn't cached
+        """
+        with self._lock:
+            labels = _labels_key(labels)
+            oldest = self.clock() - self.max_stale
+            exact = self._ranges.get((start, end, labels)) or self._ranges.get((start, end, None))
+            entries = [exact] if exact is not None and exact.expires > oldest else \
+                self._find_covering(start, end, labels, oldest)
+            if entries is None:
+                return None
+            found = []
+            for event_id in event_ids:
+                for entry in entries:
+                    event = entry.index.get(event_id)
+                    if event is not None:
+                        found.append(event)
+                        break
+            return found
+
+    def put(self, start, end, events, labels=None, ttl=None):
+        """
+        Stores the events ABE returned for a date range.
+        :param {str} start: the first day of the range ('YYYY-MM-DD')
+        :param {str} end: the day after the last day of the range ('YYYY-MM-DD')
+        :param {list} events: the events in the range
+        :param {list} labels: (optional) the labels ABE filtered the events by, if any
+        :param {int} ttl: (optional) seconds until the range goes stale, defaults to the cache's ttl
+        :return {EventIndex}: the index built for the range's events
+        """
+        index = EventIndex(events, self.event_class.to_zone)  # Sort outside the lock
+        with self._lock:
+            key = (start, end, _labels_key(labels))
+            self._discard(key)
+            entry = _CachedRange(key, index, self.clock() + (self.ttl if ttl is None else ttl))
+            self._ranges[key] = entry
+            self._size += len(entry.index)
+            self.version += 1
+            self._evict()
+            return entry.index
+
+    def clear(self):
+        with self._lock:
+            self._ranges.clear()
+            self._size = 0
+            self.version += 1
+
+    def _hit(self, events, entries, now):
+        stale = any(entry.expires <= now for entry in entries)
+        if stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return EventList(events, stale=stale)
+
+    def _merge(self, covering, start, end, labels):
+        events = []
+        seen = set()
+        first_day, end_day = parse_date(start), parse_date(end)  # Local midnights, rather than UTC dates
+        for entry in covering:
+            self._ranges.move_to_end(entry.key)
+            for event in entry.index.between(first_day, end_day, labels):
+                key = event.id or id(event)
+                if key not in seen:
+                    seen.add(key)
+                    events.append(event)
+        if len(covering) > 1:
+            events.sort(key=lambda event: event.start_key)
+        return events
+
+    def _find_covering(self, start, end, labels, min_expiry):
+        """
+        Returns ranges expiring after min_expiry whose union covers [start, end), or None if there's a gap. Ranges
+        fetched with a label filter only cover queries for the same labels.
+        """
+        candidates = sorted((entry for entry in self._ranges.values()
+                             if entry.expires > min_expiry and entry.start < end and entry.end > start
+                             and entry.labels in (None, labels)),
+                            key=lambda entry: entry.start)
+        covering = []
+        covered_to = start
+        for entry in candidates:
+            if entry.start > covered_to:
+                break  # There's a gap that nothing covers
+            if entry.end > covered_to:
+                covering.append(entry)
+                covered_to = entry.end
+            if covered_to >= end:
+                return covering
+        return None
+
+    def _discard(self, key):
+        entry = self._ranges.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.index)
+
+    def _evict(self):
+        now = self.clock()
+        for key in [key for key, entry in self._ranges.items() if entry.expires + self.max_stale <= now]:
+            self._discard(key)
+        while self._size > self.max_events and len(self._ranges) > 1:
+            self._discard(next(iter(self._ranges)))
+
+
+def _labels_key(labels):
+    return frozenset(labels) if labels else None
+
+
+class _CachedRange:
+    __slots__ = ('key', 'start', 'end', 'labels', 'index', 'expires')
+
+    def __init__(self, key, index, expires):
+        self.key = key
+        self.start, self.end, self.labels = key
+        self.index = index
+        self.expires = expires
+
+
+class EventList(list):
+    """
+    A list of events that remembers whether it was served from a range that had outlived its TTL, and so may be out of
+    date, and whether it is only part of the events ABE has (because there wasn't time to read them all).
+    """
+
+    def __init__(self, events=(), stale=False, partial=False):
+        super().__init__(events)
+        self.stale = stale
+        self.partial = partial
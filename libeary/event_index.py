@@ -0,0 +1,108 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from .abe_event import ABEEvent
+from .label_index import LabelIndex, positions
+
+_KEY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class EventIndex:
+    """
+    EventIndex holds a set of events sorted by start time, so that range queries are bisect lookups instead of scans.
+
+    Events are ordered by their raw ABE start timestamps (UTC, 'YYYY-MM-DD HH:MM:SS'), which sort chronologically
+    as strings, so building the index doesn't parse any dates. Query bounds can be given either as such strings (or
+    'YYYY-MM-DD' prefixes of them, which are UTC dates) or as datetimes; naive datetimes and dates are taken to be in
+    the index's zone (the calendar's local time zone).
+
+    Labels are indexed by a LabelIndex, so label filters are bitset operations rather than per-event checks.
+    """
+
+    def __init__(self, events, zone=None):
+        """
+        :param {list} events: the events
+        :param {tzinfo} zone: (optional) the time zone of naive query bounds; defaults to ABEEvent.to_zone
+        """
+        self.zone = zone
+        self.events = sorted(events, key=lambda event: event.start_key)
+        self._keys = [event.start_key for event in self.events]
+        self._labels = LabelIndex(self.events)
+        self._by_id = None  # Built on first lookup by ID
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def get(self, event_id):
+        """
+        Looks up an event by its ABE ID.
+        :param {str} event_id: the ID
+        :return {ABEEvent}: the event, or None if it isn't in the index
+        """
+        if self._by_id is None:
+            self._by_id = {event.id: event for event in self.events}
+        return self._by_id.get(event_id)
+
+    def between(self, start=None, end=None, labels=None, exact_match=False):
+        """
+        Finds the events starting within [start, end).
+        :param start: (optional) the lower bound (inclusive); defaults to the first event
+        :param end: (optional) the upper bound (exclusive); defaults to after the last event
+        :param {list} labels: (optional) only return events with at least one of these labels
+        :param {boolean} exact_match: if True, only return events with all of the labels
+        :return {list}: the events, in order of start time
+        """
+        lo = 0 if start is None else bisect_left(self._keys, _key(start, self.zone))
+        hi = len(self._keys) if end is None else bisect_left(self._keys, _key(end, self.zone))
+        if not labels:
+            return self.events[lo:hi]
+        matching = self._labels.matching(labels, exact_match)
+        return [self.events[position] for position in positions(matching, lo, hi)]
+
+    def next(self, after, count, labels=None):
+        """
+        Finds the first events starting at or after a time.
+        :param after: the earliest start time
+        :param {int} count: the most events to return
+        :param {list} labels: (optional) only return events with at least one of these labels
+        :return {list}: the events, in order of start time
+        """
+        lo = bisect_left(self._keys, _key(after, self.zone))
+        if not labels:
+            return self.events[lo:lo + count]
+        matching = self._labels.matching(labels)
+        return [self.events[position] for position in positions(matching, lo)[:count]]
+
+    def on_date(self, day, labels=None):
+        """
+        Finds the events starting on a (local) day.
+        :param {date} day: the day
+        :param {list} labels: (optional) only return events with at least one of these labels
+        :return {list}: the events, in order of start time
+        """
+        midnight = datetime.combine(day, time())
+        return self.between(midnight, midnight + timedelta(days=1), labels)
+
+    def at_time(self, moment, window=timedelta(hours=1), labels=None):
+        """
+        Finds the events starting at a time, or within the window that follows it.
+        :param {datetime} moment: the time
+        :param {timedelta} window: how long after the time an event can start and still count
+        :param {list} labels: (optional) only return events with at least one of these labels
+        :return {list}: the events, in order of start time
+        """
+        return self.between(moment, moment + window, labels)
+
+
+def _key(value, zone=None):
+    """Converts a query bound into the form of ABEEvent.start_key, reading naive bounds as times in zone."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ABEEvent.to_zone if zone is None else zone)
+    return value.astimezone(ABEEvent.from_zone).strftime(_KEY_FORMAT)
@@ -0,0 +1,96 @@
+import codecs
+import time
+
+from . import metrics
+from .abe_event import ABEEvent
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(chunks):
+    """
+    Parses a JSON array incrementally, yielding each item as soon as enough of the input has arrived, so that neither
+    the whole text nor the whole parsed list has to be held in memory.
+    :param {iterable} chunks: the JSON text, as a sequence of UTF-8 encoded bytes
+    :return {generator}: the items of the array
+    :raise {json.JSONDecodeError}: if the input isn't a well-formed JSON array
+    """
+    import json  # Not needed for a LaunchRequest, so not imported on a cold start
+    raw_decode = _timed(json.JSONDecoder().raw_decode, 'json_decode')
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    state = 'start'  # 'start' -> 'item' <-> 'separator' -> 'done'
+    final = False
+    chunks = iter(chunks)
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buffer += text_decoder.decode(chunk or b'', final=final)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+            if state == 'start':
+                if buffer[pos] != '[':
+                    raise json.JSONDecodeError('Expecting an array', buffer, pos)
+                state = 'first item'
+                pos += 1
+            elif state == 'separator':
+                if buffer[pos] == ']':
+                    return
+                if buffer[pos] != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                state = 'item'
+                pos += 1
+            elif state == 'first item' and buffer[pos] == ']':
+                return
+            else:
+                try:
+                    item, end = raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break  # Wait for the rest of the item
+                if end == len(buffer) and not final:
+                    break  # A number could still be continued by the next chunk
+                yield item
+                state = 'separator'
+                pos = end
+        buffer = buffer[pos:]
+    raise json.JSONDecodeError('Unterminated array', buffer, len(buffer))
+
+
+def iter_events(chunks, labels=None, event_class=ABEEvent):
+    """
+    Builds events from an ABE /events/ response body as it is read, dropping the ones that don't match the filters
+    before the next item is parsed.
+    :param {iterable} chunks: the response body, as a sequence of bytes
+    :param {list} labels: (optional) only keep events with at least one of these labels
+    :param {type} event_class: the class of the events (ABEEvent, or a subclass for another time zone)
+    :return {generator}: the events
+    """
+    make_event = _timed(event_class, 'event_construction')
+    events = (make_event(item) for item in iter_json_array(chunks))
+    if labels:
+        has_labels = _timed(lambda event: event.has_labels(labels), 'filter')
+        events = (event for event in events if has_labels(event))
+    return events
+
+
+def _timed(function, phase):
+    """Wraps a function so that its running time is added to a phase of the current invocation, if it's recorded."""
+    invocation = metrics.current()
+    if not invocation.enabled:
+        return function
+    add_time = invocation.add_time
+    clock = time.perf_counter
+
+    def timed(*args):
+        began = clock()
+        try:
+            return function(*args)
+        finally:
+            add_time(phase, clock() - began)
+    return timed
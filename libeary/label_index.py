@@ -0,0 +1,80 @@
+import threading
+
+# Labels are interned into small integer IDs, shared by every index in the process
+_label_ids = {}
+# Indexes are built on several threads at once (background refreshes, concurrent fetches), and two new labels mustn't
+# get the same ID
+_label_ids_lock = threading.Lock()
+
+
+def label_id(label):
+    """
+    Returns the integer ID of a label, assigning one the first time the label is seen.
+    :param {str} label: the label
+    :return {int}: its ID
+    """
+    try:
+        return _label_ids[label]
+    except KeyError:
+        with _label_ids_lock:
+            return _label_ids.setdefault(label, len(_label_ids))
+
+
+class LabelIndex:
+    """
+    LabelIndex maps each label ID to a bitset (a Python int) of the positions of the events that carry it, so "any of
+    these labels" and "all of these labels" queries are unions and intersections over the whole collection at once.
+    """
+
+    def __init__(self, events):
+        """
+        :param {list} events: the events, in the order whose positions the bitsets refer to
+        """
+        self._bitsets = {}  # label ID -> bitset of event positions
+        bit = 1
+        for event in events:
+            for label in event.labels:
+                key = label_id(label)
+                self._bitsets[key] = self._bitsets.get(key, 0) | bit
+            bit <<= 1
+        self._all = bit - 1
+
+    def matching(self, labels, exact_match=False):
+        """
+        Finds the events with one or all of the specified labels.
+        :param {list} labels: the labels to look for
+        :param {boolean} exact_match: if True, events must have all of the labels, otherwise any one is adequate
+        :return {int}: the bitset of matching positions
+        """
+        if not labels:
+            return self._all
+        bitsets = (self._bitsets.get(_label_ids.get(label), 0) for label in labels)
+        if exact_match:
+            result = self._all
+            for bitset in bitsets:
+                result &= bitset
+            return result
+        result = 0
+        for bitset in bitsets:
+            result |= bitset
+        return result
+
+
+def positions(bitset, lo=0, hi=None):
+    """
+    Lists the set bits of a bitset, in ascending order.
+    :param {int} bitset: the bitset
+    :param {int} lo: (optional) ignore positions below this one
+    :param {int} hi: (optional) ignore positions from this one on
+    :return {list}: the positions
+    """
+    bitset >>= lo
+    if hi is not None:
+        bitset &= (1 << (hi - lo)) - 1
+    bits = bin(bitset)[:1:-1]  # Least significant bit first
+    found = []
+    position = bits.find('1')
+    while position != -1:
+        found.append(position + lo)
+        position = bits.find('1', position + 1)
+    return found
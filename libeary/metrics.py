@@ -0,0 +1,185 @@
+"""
+Per-invocation timing instrumentation, emitted as CloudWatch Embedded Metric Format (EMF) log lines.
+
+lambda_handler starts an Invocation for each request; code further down finds it with current() and records how
+long each phase took. When an invocation isn't sampled (or outside of lambda_handler, e.g. on a background refresh
+thread) current() returns a recorder that does nothing, so instrumented code doesn't need to check.
+"""
+
+import random
+import sys
+import threading
+import time
+
+_local = threading.local()
+
+
+class Invocation:
+    """Records the phase timings (in seconds) and other values for one invocation."""
+
+    enabled = True
+
+    def __init__(self, name=None):
+        self.name = name
+        self.timings = {}
+        self.values = {}
+        self.units = {}  # name -> CloudWatch unit of the value
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Times a block of code, adding to any time already recorded for the phase:
+
+            with metrics.current().phase('render'):
+                ...
+        """
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1, unit='Count'):
+        """
+        Adds to a counter.
+        :param {str} name: the metric name
+        :param {int} amount: how much to add
+        :param {str} unit: the CloudWatch unit, e.g. 'Count', or 'Bytes' for sizes
+        """
+        self.values[name] = self.values.get(name, 0) + amount
+        self.units[name] = unit
+
+    def set(self, name, value, unit='None'):
+        self.values[name] = value
+        self.units[name] = unit
+
+
+class _Phase:
+    __slots__ = ('invocation', 'name', 'began')
+
+    def __init__(self, invocation, name):
+        self.invocation = invocation
+        self.name = name
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.invocation.add_time(self.name, time.perf_counter() - self.began)
+
+
+class _NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _NullInvocation:
+    """Stands in for an Invocation that isn't being recorded."""
+
+    enabled = False
+    _phase = _NullPhase()
+
+    @property
+    def name(self):
+        return None
+
+    @name.setter
+    def name(self, name):
+        pass
+
+    def phase(self, name):
+        return self._phase
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, amount=1, unit='Count'):
+        pass
+
+    def set(self, name, value, unit='None'):
+        pass
+
+
+NULL_INVOCATION = _NullInvocation()
+
+
+def current():
+    """
+    :return {Invocation}: the invocation being recorded on this thread, or a recorder that does nothing
+    """
+    return getattr(_local, 'invocation', NULL_INVOCATION)
+
+
+class Metrics:
+    """
+    Metrics decides which invocations to record and hands the finished ones to a sink.
+    """
+
+    def __init__(self, sink, sample_rate=1.0):
+        """
+        :param sink: receives each recorded Invocation when it finishes (see EMFSink and NullSink)
+        :param {float} sample_rate: the fraction of invocations to record
+        """
+        self.sink = sink
+        self.sample_rate = sample_rate
+
+    def start(self, name=None):
+        """
+        Starts recording an invocation on this thread (if it's sampled).
+        :param {str} name: (optional) what's being invoked, e.g. the intent name
+        :return {Invocation}: the recorder for the invocation
+        """
+        if isinstance(self.sink, NullSink) or random.random() >= self.sample_rate:
+            invocation = NULL_INVOCATION
+        else:
+            invocation = Invocation(name)
+        _local.invocation = invocation
+        return invocation
+
+    def finish(self):
+        """Stops recording this thread's invocation, and emits it."""
+        invocation = current()
+        _local.invocation = NULL_INVOCATION
+        if invocation.enabled:
+            invocation.add_time('total', time.perf_counter() - invocation.started)
+            self.sink.emit(invocation)
+
+
+class EMFSink:
+    """
+    Writes each invocation as a CloudWatch Embedded Metric Format JSON line. Lambda sends stdout to CloudWatch Logs,
+    which turns these lines into metrics without any API calls.
+    """
+
+    def __init__(self, namespace='OlinABE', stream=None):
+        self.namespace = namespace
+        self.stream = stream
+
+    def emit(self, invocation):
+        import json  # Kept off the cold start path
+        metrics = [{'Name': name + 'Ms', 'Unit': 'Milliseconds'} for name in invocation.timings]
+        metrics += [{'Name': name, 'Unit': invocation.units.get(name, 'None')} for name in invocation.values]
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Intent']],
+                    'Metrics': metrics,
+                }],
+            },
+            'Intent': invocation.name or 'Unknown',
+        }
+        for name, seconds in invocation.timings.items():
+            document[name + 'Ms'] = round(seconds * 1000, 3)
+        document.update(invocation.values)
+        (self.stream or sys.stdout).write(json.dumps(document) + '\n')
+
+
+class NullSink:
+    """Discards invocations; for local runs. Metrics with a NullSink doesn't record anything at all."""
+
+    def emit(self, invocation):
+        pass
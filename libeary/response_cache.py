@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    ResponseCache remembers the finished responses to popular questions, so that asking the same thing again (e.g.
+    "what's happening tomorrow") is answered with a dict lookup instead of querying and rendering the events again.
+
+    Each lookup passes the version of the calendar the answer would be built from. When it differs from the version
+    the cached responses were built from, they are all dropped. Responses also expire after ttl seconds, so that they
+    never outlive the events they were built from. The least recently used responses are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=256, ttl=300, clock=time.monotonic):
+        """
+        :param {int} max_entries: the most responses to keep (0 to keep none)
+        :param {int} ttl: the number of seconds a response may be reused for
+        :param {function} clock: returns the current time in seconds (swappable for tests)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._responses = OrderedDict()  # key -> (expires, response), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        :param key: what was asked, e.g. (intent name, slot value, labels)
+        :param version: the version of the calendar the response would be built from
+        :return {dict}: the cached response, or None. It is shared, so must not be modified.
+        """
+        with self._lock:
+            if version != self._version:
+                self._responses.clear()
+                self._version = version
+            entry = self._responses.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self.misses += 1
+                return None
+            self._responses.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, response):
+        """
+        Remembers a response.
+        :param key: what was asked
+        :param version: the version of the calendar the response was built from
+        :param {dict} response: the response
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self._version:
+                self._responses.clear()
+                self._version = version
+            self._responses[key] = (self.clock() + self.ttl, response)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
@@ -0,0 +1,69 @@
+import threading
+
+from . import metrics
+
+
+class SingleFlight:
+    """
+    SingleFlight coalesces concurrent calls for the same thing: while one caller (the leader) is running the function
+    for a key, other callers with the same key wait for it to finish and share its result, instead of each making
+    the same request to ABE. Calls made after the leader has finished start a new flight.
+
+    The shared result is the same object for every caller, so it must not be modified.
+    """
+
+    def __init__(self):
+        self.calls = 0  # Calls that ran the function
+        self.coalesced = 0  # Calls that waited on another caller's
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout=None):
+        """
+        Calls function, unless a call for the same key is already in flight, in which case its result is waited for.
+        :param key: identifies what the function fetches, e.g. (start, end, labels)
+        :param {function} function: called with no arguments
+        :param {float} timeout: (optional) the most seconds to wait on another caller's call
+        :return: the function's result, or None if the wait timed out
+        :raise: whatever the function raised, if it raised
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            metrics.current().count('coalesced_requests')
+            if not flight.done.wait(timeout):
+                return None
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    @property
+    def in_flight(self):
+        """The number of keys with a call in flight."""
+        return len(self._flights)
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
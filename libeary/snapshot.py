@@ -0,0 +1,286 @@
+"""
+Snapshots of the coming events, written ahead of time by a scheduled invocation so that the voice path can answer
+from them without waiting on ABE.
+
+A snapshot is a gzipped JSON document holding the events column by column, sorted by start time, with each event's
+start and end already converted to local time (as an epoch time and a UTC offset). Loading one is a JSON decode and a
+loop that builds the events, with no timestamp parsing or time zone lookups.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from .abe_event import ABEEvent
+from .event_index import EventIndex
+
+FORMAT = 1
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """The events between two dates, as of when the snapshot was taken."""
+
+    def __init__(self, start, end, created, events, zone=None):
+        """
+        :param {str} start: the first day covered ('YYYY-MM-DD')
+        :param {str} end: the day after the last day covered ('YYYY-MM-DD')
+        :param {float} created: when the snapshot was taken, as a Unix time
+        :param {list} events: the events
+        :param {tzinfo} zone: (optional) the calendar's time zone, which its days are local to
+        """
+        self.start = start
+        self.end = end
+        self.created = created
+        self.index = EventIndex(events, zone)
+
+    def covers(self, start, end):
+        """
+        :param {str} start: the first day of a query ('YYYY-MM-DD')
+        :param {str} end: the day after the last day of the query ('YYYY-MM-DD')
+        :return {boolean}: True if the snapshot holds all the events in the range
+        """
+        return self.start <= start and end <= self.end
+
+
+def dump_snapshot(events, start, end, created=None):
+    """
+    Serializes events into a snapshot.
+    :param {list} events: the events
+    :param {str} start: the first day the events were fetched for ('YYYY-MM-DD')
+    :param {str} end: the day after the last day the events were fetched for ('YYYY-MM-DD')
+    :param {float} created: (optional) when the events were fetched, as a Unix time; defaults to now
+    :return {bytes}: the snapshot, gzipped
+    """
+    import gzip
+    import json
+    events = sorted(events, key=lambda event: event.start_key)
+    label_names = sorted({label for event in events for label in event.labels})
+    label_numbers = {label: number for number, label in enumerate(label_names)}
+    if events:
+        type(events[0]).localize(events)  # In the events' own time zone
+    start_times, start_offsets = zip(*(_epoch_and_offset(event.start) for event in events)) if events else ((), ())
+    end_times, end_offsets = zip(*(_epoch_and_offset(event.end) for event in events)) if events else ((), ())
+    document = {
+        'format': FORMAT,
+        'start': start,
+        'end': end,
+        'created': time.time() if created is None else created,
+        'labels': label_names,
+        'events': {
+            'id': [event.id for event in events],
+            'title': [event.title for event in events],
+            'start': [event.start_key for event in events],
+            'end': [event.end_key for event in events],
+            'location': [event.location for event in events],
+            'all_day': [event.all_day for event in events],
+            'labels': [sorted(label_numbers[label] for label in event.labels) for event in events],
+            'start_time': start_times,
+            'start_offset': start_offsets,
+            'end_time': end_times,
+            'end_offset': end_offsets,
+        },
+    }
+    return gzip.compress(json.dumps(document, separators=(',', ':')).encode(), compresslevel=9)
+
+
+def load_snapshot(data, event_class=ABEEvent):
+    """
+    Deserializes a snapshot written by dump_snapshot.
+    :param {bytes} data: the snapshot, gzipped
+    :param {type} event_class: the class of the events (ABEEvent, or a subclass for another time zone)
+    :return {Snapshot}: the snapshot
+    :raise {ValueError}: if the data isn't a snapshot in a format this version understands
+    """
+    import json
+    import zlib
+    document = json.loads(zlib.decompress(data, 16 + zlib.MAX_WBITS).decode())
+    if document.get('format') != FORMAT:
+        raise ValueError('unsupported snapshot format {!r}'.format(document.get('format')))
+    columns = document['events']
+    label_names = document['labels']
+    label_sets = {}  # Events with the same labels share a frozenset
+    zones = {}  # ...and a UTC offset
+    make = event_class.from_fields
+    events = []
+    append = events.append
+    for (event_id, title, start_key, end_key, location, all_day, label_numbers, start_time, start_offset, end_time,
+         end_offset) in zip(columns['id'], columns['title'], columns['start'], columns['end'], columns['location'],
+                            columns['all_day'], columns['labels'], columns['start_time'], columns['start_offset'],
+                            columns['end_time'], columns['end_offset']):
+        key = tuple(label_numbers)
+        labels = label_sets.get(key)
+        if labels is None:
+            labels = label_sets[key] = frozenset(label_names[number] for number in label_numbers)
+        append(make(event_id, title, start_key, end_key, location, all_day, labels,
+                    _local_time(start_time, start_offset, zones), _local_time(end_time, end_offset, zones)))
+    return Snapshot(document['start'], document['end'], document['created'], events, event_class.to_zone)
+
+
+def _epoch_and_offset(local):
+    if local is None:
+        return None, None
+    return int(local.timestamp()), int(local.utcoffset().total_seconds() // 60)
+
+
+def _local_time(timestamp, offset, zones):
+    if timestamp is None:
+        return None
+    zone = zones.get(offset)
+    if zone is None:
+        zone = zones[offset] = timezone(timedelta(minutes=offset))
+    return datetime.fromtimestamp(timestamp, zone)
+
+
+class DirectoryStore:
+    """Keeps snapshots as files in a local directory (for running locally, or on a mounted file system)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, name):
+        """:return {bytes}: the named snapshot, or None if there isn't one"""
+        try:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, data):
+        """Saves a snapshot, replacing the old one only once the new one has been completely written."""
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def version(self, name):
+        """:return: a value that changes whenever the named snapshot is replaced, or None if there isn't one"""
+        try:
+            stat = os.stat(os.path.join(self.path, name))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+class S3Store:
+    """Keeps snapshots as objects in an S3 bucket. boto3 (which Lambda provides) is imported on first use."""
+
+    def __init__(self, bucket, prefix=''):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = None
+
+    def get(self, name):
+        """:return {bytes}: the named snapshot, or None if there isn't one"""
+        client = self._s3()
+        try:
+            return client.get_object(Bucket=self.bucket, Key=self.prefix + name)['Body'].read()
+        except client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, name, data):
+        """Saves a snapshot."""
+        self._s3().put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data,
+                              ContentType='application/json', ContentEncoding='gzip')
+
+    def version(self, name):
+        """:return: a value that changes whenever the named snapshot is replaced, or None if there isn't one"""
+        from botocore.exceptions import ClientError
+        try:
+            return self._s3().head_object(Bucket=self.bucket, Key=self.prefix + name)['ETag']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _s3(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+
+def open_store(location):
+    """
+    :param {str} location: an S3 location ('s3://bucket/prefix/') or a local directory
+    :return: a store for snapshots at that location
+    """
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Store(bucket, prefix)
+    return DirectoryStore(location)
+
+
+class Snapshots:
+    """
+    Snapshots saves snapshots to a store, and keeps the latest one in memory between warm invocations. Reading the
+    store is kept apart from reading the snapshot: reload checks the store for a newer snapshot (at most every
+    check_interval seconds), and only downloads and loads it if it has changed, while latest just returns the one in
+    memory, so that answering a question never waits on the store.
+    """
+
+    def __init__(self, store, name='events.json.gz', check_interval=60, event_class=ABEEvent, clock=time.monotonic):
+        """
+        :param store: where the snapshots are kept (a DirectoryStore or S3Store)
+        :param {str} name: the snapshot's name in the store
+        :param {int} check_interval: the number of seconds between checks for a newer snapshot
+        :param {type} event_class: the class of the events (ABEEvent, or a subclass for another time zone)
+        :param {function} clock: returns the current time in seconds (swappable for tests)
+        """
+        self.store = store
+        self.event_class = event_class
+        self.name = name
+        self.check_interval = check_interval
+        self.clock = clock
+        self._snapshot = None
+        self._version = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def latest(self):
+        """
+        :return {Snapshot}: the snapshot that reload last loaded, or None if there isn't one. Only memory is read.
+        """
+        return self._snapshot
+
+    def due(self):
+        """:return {boolean}: True if check_interval has passed since the store was last checked"""
+        return self._checked is None or self.clock() - self._checked >= self.check_interval
+
+    def reload(self):
+        """
+        Checks the store for a newer snapshot, if check_interval has passed since the last check, and loads it. This
+        can take a while (e.g. an S3 request and a download, and the first time, importing boto3), so it's meant for
+        warm-up or a background thread rather than the voice path.
+        :return {Snapshot}: the latest snapshot, or None if there isn't one. If the store can't be read, the snapshot
+        already in memory (if any) is returned.
+        """
+        with self._lock:
+            if not self.due():
+                return self._snapshot
+            self._checked = self.clock()
+            try:
+                version = self.store.version(self.name)
+                if version != self._version:
+                    data = self.store.get(self.name)
+                    self._snapshot = None if data is None else load_snapshot(data, self.event_class)
+                    self._version = version
+            except Exception as e:  # A snapshot is an optimization; without one, the caller asks ABE
+                logger.warning('Error reading snapshot %s: %s', self.name, e)
+            return self._snapshot
+
+    def save(self, events, start, end):
+        """
+        Takes a snapshot of events and saves it to the store, where the next check by every container will find it.
+        :param {list} events: the events
+        :param {str} start: the first (local) day the events cover ('YYYY-MM-DD')
+        :param {str} end: the day after the last day the events cover ('YYYY-MM-DD')
+        :return {int}: the size of the snapshot, in bytes
+        """
+        data = dump_snapshot(events, start, end)
+        self.store.put(self.name, data)
+        return len(data)
@@ -0,0 +1,85 @@
+"""
+Turns lists of events into what Alexa says about them.
+"""
+
+from . import metrics
+
+# Alexa rejects responses whose outputSpeech is longer than this
+MAX_SPEECH_LENGTH = 8000
+
+# Templates are bound once, rather than parsed on every use
+_event_sentence = " {}, there's {} {}.".format
+_more_sentence = ' And {} more.'.format
+_ssml_document = '<speak>{}</speak>'.format
+
+_SSML_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&apos;'})
+
+# "On Tuesday at 05:00 AM" etc., by (start timestamp, all day, event class, which differs by time zone). Several
+# events often share a start time, and the same events are spoken again and again while they're cached.
+_start_phrases = {}
+_MAX_START_PHRASES = 4096
+
+
+def start_phrase(event):
+    """
+    Says when an event starts, e.g. 'On Tuesday at 05:00 AM', reusing the phrase already formatted for another
+    event that starts at the same time.
+    :param {ABEEvent} event: the event
+    :return {str}: the phrase
+    """
+    key = (event.start_key, bool(event.all_day), type(event))
+    phrase = _start_phrases.get(key)
+    if phrase is None:
+        if len(_start_phrases) >= _MAX_START_PHRASES:
+            _start_phrases.clear()
+        phrase = _start_phrases[key] = event.get_start_speech()
+    return phrase
+
+
+def render_events(intro, events, ssml=False, max_length=MAX_SPEECH_LENGTH, outro='', max_events=None):
+    """
+    Builds the speech for a list of events in one pass. If saying every event would make the speech longer than
+    max_length (or there are more than max_events), the list is cut off after the last event that fits and the rest
+    are summarized as "And N more."
+    :param {str} intro: the sentence to say before the events
+    :param {list} events: the events to say
+    :param {boolean} ssml: if True, return an SSML document instead of plain text
+    :param {int} max_length: the most characters the speech may take up
+    :param {str} outro: (optional) a sentence to say after the events
+    :param {int} max_events: (optional) the most events to say
+    :return {str}: the speech
+    """
+    with metrics.current().phase('render'):
+        return _render(intro, events, ssml, max_length, outro, max_events)
+
+
+def _render(intro, events, ssml, max_length, outro, max_events):
+    escape = _escape_ssml if ssml else _identity
+    parts = [escape(intro)]
+    # Leave room for the wrapping tags and the "And N more." sentence
+    outro = escape(outro)
+    budget = max_length - len(parts[0]) - len(_more_sentence(len(events))) - len(outro)
+    if ssml:
+        budget -= len(_ssml_document(''))
+    for said, event in enumerate(events):
+        if said == max_events:
+            parts.append(_more_sentence(len(events) - said))
+            break
+        part = escape(_event_sentence(start_phrase(event), event.title,
+                                      'in ' + event.location if event.location else ''))
+        budget -= len(part)
+        if budget < 0:
+            parts.append(_more_sentence(len(events) - said))
+            break
+        parts.append(part)
+    parts.append(outro)
+    text = ''.join(parts)
+    return _ssml_document(text) if ssml else text
+
+
+def _escape_ssml(text):
+    return text.translate(_SSML_ESCAPES)
+
+
+def _identity(text):
+    return text
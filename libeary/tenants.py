@@ -0,0 +1,91 @@
+from .abe_client import ABEClient
+from .abe_event import ABEEvent
+from .event_cache import EventCache
+from .response_cache import ResponseCache
+from .snapshot import Snapshots, open_store
+
+
+class Tenant:
+    """
+    Tenant holds everything needed to answer questions about one calendar: a client (with its own connection pool)
+    for the calendar's ABE server, caches of its events and responses, its snapshots, if any, and the class of its
+    events, which converts their times to the calendar's time zone.
+    """
+
+    def __init__(self, name, url, zone='America/New_York', max_events=5000, ttl=300, max_stale=86400, pool_size=4,
+                 response_cache_size=256, snapshot=None):
+        """
+        :param {str} name: a name for the tenant, for logs and background refresh keys
+        :param {str} url: the calendar's ABE server, e.g. 'https://abe-dev.herokuapp.com'
+        :param {str} zone: the calendar's time zone, e.g. 'America/New_York'
+        :param {int} max_events: the most events to keep in the tenant's event cache
+        :param {int} ttl: the number of seconds fetched events stay fresh
+        :param {int} max_stale: the number of seconds past their TTL that events can still be served as stale
+        :param {int} pool_size: the most idle connections to keep open to the ABE server
+        :param {int} response_cache_size: the most finished responses to keep
+        :param {str} snapshot: (optional) where the tenant's snapshots are kept ('s3://bucket/prefix/' or a
+        directory)
+        """
+        self.name = name
+        self.zone = zone
+        self.event_class = ABEEvent.in_zone(zone)
+        self.client = ABEClient(url, pool_size=pool_size)
+        self.event_cache = EventCache(ttl=ttl, max_events=max_events, max_stale=max_stale, event_class=self.event_class)
+        self.response_cache = ResponseCache(max_entries=response_cache_size, ttl=ttl)
+        self.snapshots = Snapshots(open_store(snapshot), event_class=self.event_class) if snapshot else None
+
+    def __repr__(self):
+        return 'Tenant({!r})'.format(self.name)
+
+
+class Tenants:
+    """
+    Tenants maps the skills (by their AVS application IDs) that a deployment answers for to their calendars, so that
+    one warm process can serve several. Requests from skills that aren't configured are answered from the default
+    tenant's calendar.
+    """
+
+    def __init__(self, default, by_application_id=None):
+        """
+        :param {Tenant} default: the tenant for requests from unconfigured skills
+        :param {dict} by_application_id: (optional) AVS application ID -> Tenant
+        """
+        self.default = default
+        self.by_application_id = by_application_id or {}
+
+    @classmethod
+    def from_config(cls, config, max_events=5000, **defaults):
+        """
+        Makes the tenants for a deployment. Each skill's settings may give any of Tenant's parameters; the rest come
+        from the defaults (except snapshot, which isn't shared). The max_events limit is shared fairly: each tenant's
+        event cache gets an equal part of it, unless the tenant's settings give its own limit.
+        :param {dict} config: AVS application ID -> settings, e.g. {'amzn1.ask.skill.…': {'url': …, 'zone': …}}
+        :param {int} max_events: the most events to cache across all the tenants
+        :param defaults: Tenant's parameters for the default tenant (which must include url), and the defaults for the
+        others
+        :return {Tenants}: the tenants
+        """
+        share = max(max_events // (len(config) + 1), 1)
+        default = Tenant('default', max_events=share, **defaults)
+        by_application_id = {}
+        for application_id, settings in config.items():
+            merged = dict(defaults, name=application_id, max_events=share, snapshot=None)
+            merged.update(settings)
+            by_application_id[application_id] = Tenant(**merged)
+        return cls(default, by_application_id)
+
+    def __iter__(self):
+        yield self.default
+        yield from self.by_application_id.values()
+
+    def for_request(self, req):
+        """
+        :param req: a dictionary with the JSON values sent from AVS
+        :return {Tenant}: the tenant for the skill that sent the request
+        """
+        if not self.by_application_id:
+            return self.default
+        session = req.get('session') or {}
+        application = session.get('application') or \
+            ((req.get('context') or {}).get('System') or {}).get('application') or {}
+        return self.by_application_id.get(application.get('applicationId'), self.default)
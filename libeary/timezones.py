@@ -0,0 +1,157 @@
+"""
+Time zone lookup and fixed-format date parsing, kept off the import path so that a cold start (and in particular a
+LaunchRequest, which never needs a time zone) doesn't pay for them.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+UTC = timezone.utc
+
+_zones = {}
+_transitions = {}  # (zone, year) -> _Transitions
+
+# datetime.fromisoformat (Python 3.7+) parses in C; on older Pythons, timestamps are parsed by slicing
+_fromisoformat = getattr(datetime, 'fromisoformat', None)
+
+
+def get_zone(name):
+    """
+    Looks up a time zone by its IANA name, caching the result. The standard library's zoneinfo (Python 3.9+) is used
+    when it can find the zone, and dateutil otherwise; either is only imported on first use.
+    :param {str} name: the zone's name, e.g. 'America/New_York'
+    :return {tzinfo}: the time zone
+    """
+    zone = _zones.get(name)
+    if zone is None:
+        try:
+            from zoneinfo import ZoneInfo
+            zone = ZoneInfo(name)
+        except Exception:  # No zoneinfo module, or no tz database for it to read
+            from dateutil import tz
+            zone = tz.gettz(name)
+        _zones[name] = zone
+    return zone
+
+
+class LazyZone:
+    """A class attribute that resolves to a time zone the first time it's read."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return get_zone(self.name)
+
+
+def parse_timestamp(string, tzinfo=None):
+    """
+    Parses an ABE timestamp ('YYYY-MM-DD HH:MM:SS') by position. This is several times faster than
+    datetime.strptime, and avoids importing the _strptime module on the first call.
+    :param {str} string: the timestamp
+    :param {tzinfo} tzinfo: (optional) the time zone the timestamp is in
+    :return {datetime}: the date and time (naive, unless tzinfo is given)
+    """
+    if (len(string) != 19 or string[4] != '-' or string[7] != '-' or string[10] != ' ' or string[13] != ':'
+            or string[16] != ':'):
+        raise ValueError('time data {!r} does not match format YYYY-MM-DD HH:MM:SS'.format(string))
+    if _fromisoformat is not None:
+        if tzinfo is UTC:
+            return _fromisoformat(string + '+00:00')  # One C call, rather than parsing and then setting the zone
+        if tzinfo is None:
+            return _fromisoformat(string)
+    return datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]),
+                    int(string[11:13]), int(string[14:16]), int(string[17:19]), tzinfo=tzinfo)
+
+
+def parse_date(string):
+    """
+    Parses an AMAZON.DATE slot value for a single day ('YYYY-MM-DD') by position.
+    :param {str} string: the date
+    :return {datetime}: midnight at the start of the date
+    """
+    if len(string) != 10 or string[4] != '-' or string[7] != '-':
+        raise ValueError('time data {!r} does not match format YYYY-MM-DD'.format(string))
+    return datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]))
+
+
+def localize_timestamp(string, zone):
+    """
+    Converts an ABE timestamp (UTC, 'YYYY-MM-DD HH:MM:SS') to local time.
+    :param {str} string: the timestamp
+    :param {tzinfo} zone: the local time zone
+    :return {datetime}: the local date and time, with the zone's UTC offset at that moment as its tzinfo
+    """
+    return parse_timestamp(string, UTC).astimezone(_transitions_for(zone, string[:4]).at(string))
+
+
+def localize_timestamps(strings, zone):
+    """
+    Converts many ABE timestamps to local time at once, as localize_timestamp would. Timestamps that occur more than
+    once are only converted once.
+    :param {iterable} strings: the timestamps (or None)
+    :param {tzinfo} zone: the local time zone
+    :return {list}: the local dates and times (None for None)
+    """
+    converted = {None: None, '': None}
+    results = []
+    append = results.append
+    for string in strings:
+        value = converted.get(string)
+        if value is None and string:
+            value = converted[string] = localize_timestamp(string, zone)
+        append(value)
+    return results
+
+
+class _Transitions:
+    """
+    A zone's UTC offsets through one year, as the sorted UTC timestamps ('YYYY-MM-DD HH:MM:SS') at which they take
+    effect. Looking up the offset for an ABE timestamp is then a bisect on the string, instead of a time zone
+    database lookup.
+    """
+
+    def __init__(self, zone, year):
+        begin = datetime(year, 1, 1, tzinfo=UTC)
+        end = datetime(year + 1, 1, 1, tzinfo=UTC)
+        self.keys = ['']
+        self.offsets = [_fixed_offset(begin.astimezone(zone).utcoffset())]
+        # Offsets change at most a few times a year, and never twice in a day, so check daily and narrow down each
+        # change to the second.
+        day = timedelta(days=1)
+        previous = begin
+        while previous < end:
+            following = min(previous + day, end)
+            offset = following.astimezone(zone).utcoffset()
+            if offset != self.offsets[-1].utcoffset(None):
+                low, high = previous, following
+                while high - low > timedelta(seconds=1):
+                    middle = low + (high - low) / 2
+                    if middle.astimezone(zone).utcoffset() == offset:
+                        high = middle
+                    else:
+                        low = middle
+                self.keys.append(high.replace(microsecond=0).strftime('%Y-%m-%d %H:%M:%S'))
+                self.offsets.append(_fixed_offset(offset))
+            previous = following
+
+    def at(self, key):
+        """:return {timezone}: the UTC offset in effect at a UTC timestamp in this year"""
+        return self.offsets[bisect_right(self.keys, key) - 1]
+
+
+def _transitions_for(zone, year):
+    transitions = _transitions.get((zone, year))
+    if transitions is None:
+        transitions = _transitions[zone, year] = _Transitions(zone, int(year))
+    return transitions
+
+
+_offsets = {}
+
+
+def _fixed_offset(delta):
+    offset = _offsets.get(delta)
+    if offset is None:
+        offset = _offsets[delta] = timezone(delta)
+    return offset
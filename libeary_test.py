@@ -0,0 +1,714 @@
+import gzip
+import io
+from datetime import date, datetime
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from libeary import (ABEClient, ABEError, ABEEvent, AVSIntent, Budget, Dispatcher, EventCache, EventIndex, EventList,
+                     OutOfTime, ResponseCache, SingleFlight, Tenants, gather_events, metrics)
+from libeary.event_stream import iter_events, iter_json_array
+from libeary.label_index import LabelIndex, label_id, positions
+from libeary.snapshot import DirectoryStore, Snapshots, dump_snapshot, load_snapshot
+from libeary.speech import render_events, start_phrase
+from libeary.timezones import UTC, get_zone, localize_timestamp, localize_timestamps, parse_date, parse_timestamp
+from test_fixtures import events
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_event(start, event_id=None, labels=None):
+    return ABEEvent({'id': event_id or start, 'title': 'Event ' + start, 'start': start, 'end': start,
+                     'labels': labels or []})
+
+
+def test_event_cache_exact_hit_and_miss():
+    cache = EventCache()
+    assert cache.get('2018-02-20', '2018-02-27') is None
+    cache.put('2018-02-20', '2018-02-27', [ABEEvent(events[0])])
+    assert [event.title for event in cache.get('2018-02-20', '2018-02-27')] == ['Olin Monday']
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_ratio == 0.5
+
+
+def test_event_cache_contained_and_overlapping_ranges():
+    cache = EventCache()
+    cache.put('2018-02-20', '2018-02-24', [make_event('2018-02-20 10:00:00'), make_event('2018-02-23 10:00:00')])
+    cache.put('2018-02-22', '2018-02-27', [make_event('2018-02-23 10:00:00'), make_event('2018-02-26 10:00:00')])
+    # Contained in the first range
+    assert [event.start_key for event in cache.get('2018-02-23', '2018-02-24')] == ['2018-02-23 10:00:00']
+    # Spans both ranges; the shared event is only returned once
+    assert [event.start_key for event in cache.get('2018-02-21', '2018-02-27')] == [
+        '2018-02-23 10:00:00', '2018-02-26 10:00:00']
+    # Not covered
+    assert cache.get('2018-02-19', '2018-02-21') is None
+
+
+def test_event_cache_ttl():
+    clock = FakeClock()
+    cache = EventCache(ttl=60, clock=clock)
+    cache.put('2018-02-20', '2018-02-27', [])
+    clock.now = 59
+    assert cache.get('2018-02-20', '2018-02-27') == []
+    clock.now = 61
+    assert cache.get('2018-02-20', '2018-02-27') is None
+
+
+def test_event_cache_lru_eviction():
+    cache = EventCache(max_events=2)
+    cache.put('2018-02-20', '2018-02-21', [make_event('2018-02-20 10:00:00')])
+    cache.put('2018-02-21', '2018-02-22', [make_event('2018-02-21 10:00:00')])
+    cache.get('2018-02-20', '2018-02-21')  # Touch the first range so that the second is evicted
+    cache.put('2018-02-22', '2018-02-23', [make_event('2018-02-22 10:00:00')])
+    assert len(cache) == 2
+    assert cache.get('2018-02-21', '2018-02-22') is None
+    assert cache.get('2018-02-20', '2018-02-21') is not None
+
+
+def test_event_cache_stale_entries():
+    clock = FakeClock()
+    cache = EventCache(ttl=60, max_stale=600, clock=clock)
+    cache.put('2018-02-20', '2018-02-27', [])
+    clock.now = 61
+    events = cache.get('2018-02-20', '2018-02-27', allow_stale=True)
+    assert events == [] and events.stale
+    assert cache.stale_hits == 1
+    clock.now = 661
+    assert cache.get('2018-02-20', '2018-02-27', allow_stale=True) is None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _EventsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    statuses = []  # Statuses to respond with before answering successfully
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get('If-None-Match'), self.client_address[1]))
+        if type(self).statuses:
+            self._respond(type(self).statuses.pop(0), b'')
+        elif self.headers.get('If-None-Match') == '"v1"':
+            self._respond(304, b'')
+        else:
+            self._respond(200, gzip.compress(json.dumps(events).encode()),
+                          {'ETag': '"v1"', 'Content-Encoding': 'gzip'})
+
+    def _respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def abe_server():
+    _EventsHandler.statuses = []
+    _EventsHandler.requests = []
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _EventsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_abe_client_gzip_keep_alive_and_conditional_get(abe_server):
+    client = ABEClient(abe_server)
+    assert json.loads(client.get('/events/', {'start': '2018-02-20'}).decode()) == events
+    assert json.loads(client.get('/events/', {'start': '2018-02-20'}).decode()) == events
+    (first_path, first_etag, first_port), (_, second_etag, second_port) = _EventsHandler.requests
+    assert first_path == '/events/?start=2018-02-20'
+    assert (first_etag, second_etag) == (None, '"v1"')  # The second request was answered by a 304
+    assert first_port == second_port  # ...over the same connection
+    client.close()
+
+
+def test_abe_client_bounds_the_bodies_it_remembers(abe_server):
+    body = len(gzip.compress(json.dumps(events).encode()))
+    client = ABEClient(abe_server, max_validator_bytes=2 * body)
+    for day in range(3):
+        client.get('/events/', {'start': '2018-02-2{}'.format(day)})
+    assert list(client._validators) == ['/events/?start=2018-02-21', '/events/?start=2018-02-22']
+    assert client._validator_bytes == 2 * body
+    # Bodies over the size limit aren't kept at all
+    client = ABEClient(abe_server, max_validator_body=body - 1)
+    client.get('/events/')
+    assert not client._validators and client._validator_bytes == 0
+    client.close()
+
+
+def test_abe_client_retries(abe_server):
+    _EventsHandler.statuses = [503]
+    client = ABEClient(abe_server, backoff=0.01)
+    assert json.loads(client.get('/events/').decode()) == events
+    _EventsHandler.statuses = [503, 503]
+    with pytest.raises(ABEError):
+        ABEClient(abe_server, max_retries=1, backoff=0.01).get('/events/')
+    _EventsHandler.statuses = [404]
+    with pytest.raises(ABEError):
+        client.get('/missing/')
+    assert len(_EventsHandler.requests) == 5  # The 404 isn't retried
+    client.close()
+
+
+class _IdleTimeoutHandler(_EventsHandler):
+    timeout = 0.2  # Closes keep-alive connections after this long idle, as Heroku's router does (after longer)
+
+
+def test_abe_client_replaces_connections_the_server_closed():
+    _EventsHandler.statuses = []
+    _EventsHandler.requests = []
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _IdleTimeoutHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ABEClient('http://127.0.0.1:{}'.format(server.server_address[1]), max_retries=0, backoff=10)
+    connections = [client._acquire(1)[0] for _ in range(4)]
+    for connection in connections:
+        client._release(connection)  # A pool full of connections, as a fan-out leaves it
+    time.sleep(0.5)  # ...that the server closes while the container is idle
+    began = time.monotonic()
+    assert json.loads(client.get('/events/').decode()) == events  # Not counted as a retry, and no backoff
+    assert time.monotonic() - began < 1
+    assert len(client._idle) == 1  # The dead ones were dropped
+
+    # Connections idle for longer than max_idle aren't reused at all
+    client.max_idle = 0.1
+    time.sleep(0.2)
+    assert client._acquire(1)[1] is False
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+class _StallingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '1000')
+        self.end_headers()
+        self.wfile.write(b'[{"title": "a"}, ')
+        self.wfile.flush()
+        time.sleep(1)  # ...and then nothing more until the client has given up
+
+    def log_message(self, *args):
+        pass
+
+
+def test_abe_client_read_deadline_bounds_a_stalled_body():
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _StallingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ABEClient('http://127.0.0.1:{}'.format(server.server_address[1]))
+    began = time.monotonic()
+    body = client.stream('/events/', deadline=began + 5, read_deadline=began + 0.3)
+    assert next(body) == b'[{"title": "a"}, '
+    with pytest.raises(ABEError):
+        next(body)
+    assert time.monotonic() - began < 0.6
+    server.shutdown()
+    server.server_close()
+
+
+def _chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_json_array_across_chunk_boundaries():
+    data = json.dumps([{'title': 'Caf\u00e9 [night], "late"'}, 12345, None, []]).encode()
+    for size in (1, 2, 5, len(data)):
+        assert list(iter_json_array(_chunked(data, size))) == json.loads(data.decode())
+    assert list(iter_json_array([b' [', b' ]'])) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array([b'[{"title": 1}, ']))
+
+
+def test_iter_events_filters_as_it_streams():
+    data = json.dumps(events).encode()
+    assert [event.title for event in iter_events(_chunked(data, 16), labels=['academic'])] == [
+        'Olin Monday', 'Spring Break']
+    assert list(iter_events(_chunked(data, 16), labels=['featured'])) == []
+
+    read = []
+
+    def chunks():
+        for chunk in _chunked(data, 16):
+            read.append(chunk)
+            yield chunk
+    assert next(iter_events(chunks())).title == 'Olin Monday'
+    assert len(read) < len(_chunked(data, 16))  # Only as much of the body as the first event needed
+
+
+def test_abe_event_is_compact_and_lazy():
+    event = ABEEvent(events[0])
+    assert not hasattr(event, '__dict__')
+    assert event.labels == frozenset(['academic'])
+    assert event._start is None and event._end is None
+    assert event.start.year == 2018
+    assert event._start is not None and event._end is None
+
+
+def test_abe_event_from_list():
+    bulk = ABEEvent.from_list(events)
+    assert [(event.id, event.title, event.start, event.end, event.labels) for event in bulk] == [
+        (event.id, event.title, event.start, event.end, event.labels) for event in map(ABEEvent, events)]
+
+
+def test_abe_event_has_labels():
+    event = ABEEvent(dict(events[0], labels=['academic', 'featured']))
+    assert event.has_labels(['featured', 'sports'])
+    assert not event.has_labels(['featured', 'sports'], exact_match=True)
+    assert event.has_labels(['featured', 'academic'], exact_match=True)
+    assert event.has_labels([])
+
+
+def test_event_index_queries():
+    index = EventIndex([make_event('2018-02-23 15:00:00', labels=['featured']),
+                        make_event('2018-02-20 10:00:00', labels=['academic']),
+                        make_event('2018-02-21 14:30:00', labels=['academic', 'featured']),
+                        make_event('2018-02-21 17:00:00')])
+    assert [event.start_key for event in index] == [
+        '2018-02-20 10:00:00', '2018-02-21 14:30:00', '2018-02-21 17:00:00', '2018-02-23 15:00:00']
+    assert [event.start_key for event in index.between('2018-02-21', '2018-02-23')] == [
+        '2018-02-21 14:30:00', '2018-02-21 17:00:00']
+    assert [event.start_key for event in index.next('2018-02-21', 2, labels=['featured', 'academic'])] == [
+        '2018-02-21 14:30:00', '2018-02-23 15:00:00']
+    # Local (Eastern) times and dates
+    assert [event.start_key for event in index.on_date(date(2018, 2, 21))] == [
+        '2018-02-21 14:30:00', '2018-02-21 17:00:00']
+    assert [event.start_key for event in index.at_time(datetime(2018, 2, 21, 9, 15))] == ['2018-02-21 14:30:00']
+    assert index.between('2018-02-24', '2018-03-01') == []
+
+
+def test_label_index():
+    labelled = [make_event('2018-02-20 10:00:00', labels=['academic']),
+                make_event('2018-02-21 10:00:00', labels=['academic', 'featured']),
+                make_event('2018-02-22 10:00:00', labels=['featured']),
+                make_event('2018-02-23 10:00:00')]
+    index = LabelIndex(labelled)
+    assert positions(index.matching(['featured'])) == [1, 2]
+    assert positions(index.matching(['featured', 'academic'])) == [0, 1, 2]
+    assert positions(index.matching(['featured', 'academic'], exact_match=True)) == [1]
+    assert positions(index.matching(['unknown'])) == []
+    assert positions(index.matching([])) == [0, 1, 2, 3]
+    assert positions(index.matching(['featured', 'academic']), 1, 2) == [1]
+
+
+def test_label_ids_are_unique_across_threads():
+    labels = ['label-{}-{}'.format(thread, n) for thread in range(8) for n in range(200)]
+    threads = [threading.Thread(target=lambda chunk=labels[i::8]: [label_id(label) for label in chunk])
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({label_id(label) for label in labels}) == len(labels)
+
+
+def test_event_cache_labels():
+    cache = EventCache()
+    cache.put('2018-02-20', '2018-02-27', [make_event('2018-02-20 10:00:00', labels=['featured']),
+                                           make_event('2018-02-21 10:00:00', labels=['academic'])])
+    assert [event.start_key for event in cache.get('2018-02-20', '2018-02-27', ['featured'])] == [
+        '2018-02-20 10:00:00']
+    # A range fetched with labels pushed down to ABE only answers queries for those labels
+    cache.put('2018-03-01', '2018-03-08', [make_event('2018-03-01 10:00:00', labels=['featured'])], ['featured'])
+    assert len(cache.get('2018-03-01', '2018-03-02', ['featured'])) == 1
+    assert cache.get('2018-03-01', '2018-03-02') is None
+
+
+def test_gather_events_runs_queries_concurrently():
+    def fetch(query):
+        delay, starts = query
+        time.sleep(delay)
+        return EventList(make_event(start) for start in starts)
+
+    began = time.monotonic()
+    merged = gather_events([(0.2, ['2018-02-21 10:00:00', '2018-02-20 10:00:00']),
+                            (0.2, ['2018-02-21 10:00:00', '2018-02-22 10:00:00']),
+                            (0.2, [])], fetch)
+    assert time.monotonic() - began < 0.5
+    assert [event.start_key for event in merged] == [
+        '2018-02-20 10:00:00', '2018-02-21 10:00:00', '2018-02-22 10:00:00']
+
+    # Queries that miss the deadline are left out
+    merged = gather_events([(0, ['2018-02-20 10:00:00']), (1, ['2018-02-22 10:00:00'])], fetch,
+                           deadline=time.monotonic() + 0.3)
+    assert [event.start_key for event in merged] == ['2018-02-20 10:00:00']
+    assert gather_events([None], lambda query: None) is None
+
+    # Each pool size gets its own executor, rather than the first caller's size being used for everyone
+    from libeary.async_query import _get_executor
+    assert _get_executor(2)._max_workers == 2 and _get_executor(8)._max_workers == 8
+    assert _get_executor(2) is _get_executor(2)
+
+
+def test_gather_events_logs_failed_queries(caplog):
+    def fetch(query):
+        if query == 'broken':
+            raise ValueError('bad query')
+        return EventList([make_event('2018-02-20 10:00:00')])
+
+    merged = gather_events(['broken', 'fine'], fetch)
+    assert [event.start_key for event in merged] == ['2018-02-20 10:00:00']
+    assert [(record.name, record.levelname) for record in caplog.records] == [('libeary.async_query', 'WARNING')]
+    assert "'broken'" in caplog.text and 'bad query' in caplog.text
+
+
+def test_fixed_format_parsers():
+    assert parse_timestamp('2018-02-20 05:00:00') == datetime(2018, 2, 20, 5)
+    assert parse_date('2018-02-20') == datetime(2018, 2, 20)
+    for bad in ('2018-02-20T05:00:00', '2018-02-20'):
+        with pytest.raises(ValueError):
+            parse_timestamp(bad)
+    with pytest.raises(ValueError):
+        parse_date('20180220')
+
+
+def test_get_zone_is_cached():
+    zone = get_zone('America/New_York')
+    assert zone is get_zone('America/New_York')
+    assert datetime(2018, 7, 1, tzinfo=zone).utcoffset().total_seconds() == -4 * 3600
+    assert ABEEvent.to_zone is zone
+
+
+def test_render_events():
+    evening = make_event('2018-02-20 22:00:00')
+    evening.location = 'the Library & Café'
+    intro = 'I found 2 events.'
+    text = render_events(intro, [ABEEvent(events[0]), evening])
+    assert text == "I found 2 events. {}, there's Olin Monday . {}, there's Event 2018-02-20 22:00:00 in the " \
+                   "Library & Café.".format(start_phrase(ABEEvent(events[0])), start_phrase(evening))
+    ssml = render_events(intro, [evening], ssml=True)
+    assert ssml.startswith('<speak>I found 2 events.') and ssml.endswith('</speak>')
+    assert 'the Library &amp; Café' in ssml
+
+
+def test_render_events_is_cut_off_at_the_length_limit():
+    many = [make_event('2018-02-20 10:{:02}:00'.format(minute)) for minute in range(60)]
+    text = render_events('Lots on.', many, max_length=500)
+    assert len(text) <= 500
+    said = text.count("there's")
+    assert 0 < said < 60
+    assert text.endswith(' And {} more.'.format(60 - said))
+    assert len(render_events('Lots on.', many, ssml=True, max_length=500)) <= 500
+    assert render_events('Lots on.', many, max_events=2).endswith(" And 58 more.")
+    assert render_events('Lots on.', many, max_events=2).count("there's") == 2
+
+
+def test_event_cache_cuts_local_days():
+    cache = EventCache()
+    evening = make_event('2030-01-02 01:00:00')  # 8 pm on January 1 in New York
+    cache.put('2030-01-01', '2030-01-03', [evening])
+    assert cache.get('2030-01-01', '2030-01-02') == [evening]
+    assert cache.get('2030-01-02', '2030-01-03') == []
+    assert cache.get('2030-01-01', '2030-01-03') == [evening]
+
+    # ...in the calendar's own time zone
+    pacific = ABEEvent.in_zone('America/Los_Angeles')
+    late = pacific({'title': 'Late', 'start': '2030-01-02 06:00:00'})  # 1 am in New York, 10 pm in Los Angeles
+    eastern_cache, pacific_cache = EventCache(), EventCache(event_class=pacific)
+    eastern_cache.put('2030-01-01', '2030-01-03', [late])
+    pacific_cache.put('2030-01-01', '2030-01-03', [late])
+    assert eastern_cache.get('2030-01-02', '2030-01-03') == [late]
+    assert pacific_cache.get('2030-01-01', '2030-01-02') == [late]
+
+
+def test_event_cache_find():
+    cache = EventCache()
+    cache.put('2018-02-20', '2018-02-27',
+              [make_event('2018-02-20 10:00:00', 'a'), make_event('2018-02-21 10:00:00', 'b')])
+    assert [event.id for event in cache.find('2018-02-20', '2018-02-27', ['b', 'missing', 'a'])] == ['b', 'a']
+    assert [event.id for event in cache.find('2018-02-21', '2018-02-22', ['b'])] == ['b']
+    assert cache.find('2018-03-01', '2018-03-02', ['a']) is None
+
+
+def test_metrics_emits_emf():
+    stream = io.StringIO()
+    recorder = metrics.Metrics(metrics.EMFSink(namespace='Test', stream=stream))
+    invocation = recorder.start('WhatsHappeningNext')
+    assert metrics.current() is invocation
+    with metrics.current().phase('render'):
+        pass
+    invocation.count('payload_bytes', 100, unit='Bytes')
+    invocation.count('payload_bytes', 20, unit='Bytes')
+    invocation.count('cache_hits')
+    recorder.finish()
+    assert metrics.current() is metrics.NULL_INVOCATION
+
+    document = json.loads(stream.getvalue())
+    assert document['Intent'] == 'WhatsHappeningNext'
+    assert document['payload_bytes'] == 120
+    assert document['renderMs'] >= 0 and document['totalMs'] >= document['renderMs']
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'Test'
+    assert {'Name': 'renderMs', 'Unit': 'Milliseconds'} in directive['Metrics']
+    assert {'Name': 'payload_bytes', 'Unit': 'Bytes'} in directive['Metrics']
+    assert {'Name': 'cache_hits', 'Unit': 'Count'} in directive['Metrics']
+
+
+def test_metrics_sampling_and_null_sink():
+    assert metrics.Metrics(metrics.NullSink()).start() is metrics.NULL_INVOCATION
+    stream = io.StringIO()
+    recorder = metrics.Metrics(metrics.EMFSink(stream=stream), sample_rate=0)
+    invocation = recorder.start()
+    invocation.name = 'Ignored'
+    with invocation.phase('render'):
+        pass
+    recorder.finish()
+    assert stream.getvalue() == ''
+
+
+def test_budget():
+    clock = FakeClock()
+    budget = Budget(3.25, reserve=0.25, fetch_share=0.5, parse_share=0.3, clock=clock)
+    assert (budget.fetch_deadline, budget.parse_deadline, budget.deadline) == (1.5, 2.4, 3.0)
+    assert budget.can_fetch() and budget.max_events() is None
+    clock.now = 1.45
+    assert not budget.can_fetch()
+    clock.now = 2.99
+    assert budget.max_events() == 3
+
+    clock.now = 2.0
+    chunks = []
+    with pytest.raises(OutOfTime):
+        for chunk in budget.cut_off([b'[', b'{}', b']']):
+            chunks.append(chunk)
+            clock.now += 0.3
+    assert chunks == [b'[', b'{}']
+
+    unlimited = Budget()
+    assert unlimited.can_fetch() and unlimited.max_events() is None and unlimited.remaining() == float('inf')
+    assert list(unlimited.cut_off([b'[]'])) == [b'[]']
+
+
+def test_snapshot_round_trip():
+    original = [make_event('2018-07-01 16:00:00', 'b', ['featured']), make_event('2018-02-20 22:00:00', 'a'),
+                ABEEvent(events[1])]
+    snapshot = load_snapshot(dump_snapshot(original, '2018-02-20', '2018-08-01', created=100))
+    assert (snapshot.start, snapshot.end, snapshot.created) == ('2018-02-20', '2018-08-01', 100)
+    assert snapshot.covers('2018-03-01', '2018-03-02') and not snapshot.covers('2018-07-31', '2018-08-02')
+    loaded = list(snapshot.index)
+    assert [event.id for event in loaded] == ['a', '5a760c64e8fb6d000a5fc366', 'b']
+    assert loaded[2].labels == frozenset(['featured']) and loaded[0].labels == frozenset()
+    # Start times come back already in local time, on either side of a DST change
+    assert loaded[0].start.isoformat() == '2018-02-20T17:00:00-05:00'
+    assert loaded[2].start.isoformat() == '2018-07-01T12:00:00-04:00'
+    assert loaded[1].end.isoformat() == '2018-03-23T23:59:59-04:00'
+
+
+def test_snapshots_reload_when_the_store_changes(tmp_path):
+    clock = FakeClock()
+    snapshots = Snapshots(DirectoryStore(str(tmp_path)), check_interval=60, clock=clock)
+    assert snapshots.due() and snapshots.reload() is None
+    snapshots.save([make_event('2018-02-20 22:00:00')], '2018-02-20', '2018-02-27')
+    assert not snapshots.due() and snapshots.reload() is None  # Not checked again yet
+    clock.now = 60
+    assert snapshots.latest() is None  # Only reload reads the store
+    first = snapshots.reload()
+    assert len(first.index) == 1 and snapshots.latest() is first
+    clock.now = 120
+    assert snapshots.reload() is first  # Unchanged, so not reloaded
+    snapshots.save([make_event('2018-02-20 22:00:00'), make_event('2018-02-21 22:00:00')], '2018-02-20', '2018-02-27')
+    clock.now = 180
+    assert len(snapshots.reload().index) == 2
+    (tmp_path / 'events.json.gz').write_bytes(b'garbage')
+    clock.now = 240
+    assert len(snapshots.reload().index) == 2  # An unreadable snapshot doesn't replace the last good one
+
+
+def test_localize_timestamps_across_dst_changes(monkeypatch):
+    zone = get_zone('America/New_York')
+    around_changes = ['2018-03-11 06:59:59', '2018-03-11 07:00:00', '2018-11-04 05:59:59', '2018-11-04 06:00:00',
+                      '2018-01-01 03:00:00', '2019-07-04 16:00:00']
+    for string in around_changes:
+        expected = parse_timestamp(string).replace(tzinfo=UTC).astimezone(zone)
+        assert localize_timestamp(string, zone).isoformat() == expected.isoformat()
+    assert [value and value.isoformat() for value in localize_timestamps([None, around_changes[1]] * 2, zone)] == [
+        None, '2018-03-11T03:00:00-04:00'] * 2
+    # Without datetime.fromisoformat (as on Python 3.6)
+    monkeypatch.setattr('libeary.timezones._fromisoformat', None)
+    assert localize_timestamp(around_changes[3], zone).isoformat() == '2018-11-04T01:00:00-05:00'
+    assert parse_timestamp(around_changes[3]) == datetime(2018, 11, 4, 6)
+
+
+def test_abe_event_times_dont_depend_on_the_system_time_zone():
+    if not hasattr(time, 'tzset'):
+        pytest.skip('needs time.tzset')
+    saved = os.environ.get('TZ')
+    os.environ['TZ'] = 'Asia/Tokyo'
+    time.tzset()
+    try:
+        event = make_event('2018-02-20 22:00:00')
+        assert event.start.isoformat() == '2018-02-20T17:00:00-05:00'
+        bulk = [make_event('2018-02-20 22:00:00'), make_event('2018-07-01 16:00:00')]
+        ABEEvent.localize(bulk)
+        assert [event.start.isoformat() for event in bulk] == ['2018-02-20T17:00:00-05:00',
+                                                               '2018-07-01T12:00:00-04:00']
+    finally:
+        if saved is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = saved
+        time.tzset()
+
+
+def test_dispatcher():
+    dispatcher = Dispatcher()
+    dispatcher.static('LaunchRequest', {'launched': True})
+    dispatcher.add(['A', 'B'], lambda intent, budget=None: intent.name)
+
+    @dispatcher.handler('C')
+    def handle_c(intent, budget=None):
+        return budget
+
+    def request(name):
+        return AVSIntent({'request': {'type': 'IntentRequest', 'intent': {'name': name}}})
+
+    assert dispatcher.dispatch(AVSIntent({'request': {'type': 'LaunchRequest'}})) == {'launched': True}
+    assert [dispatcher.dispatch(request(name)) for name in 'AB'] == ['A', 'B']
+    assert dispatcher.dispatch(request('C'), budget='budget') == 'budget'
+    assert 'C' in dispatcher and 'D' not in dispatcher
+    with pytest.raises(KeyError):
+        dispatcher.dispatch(request('D'))
+    dispatcher.fallback = lambda intent, budget=None: 'fallback'
+    assert dispatcher.dispatch(request('D')) == 'fallback'
+
+
+def test_intent_slots_are_lazy():
+    intent = AVSIntent({'request': {'type': 'IntentRequest', 'intent': {'name': 'WhatsHappeningOn', 'slots': {
+        'date': {'name': 'date', 'value': '2018-02-20'}, 'time': {'name': 'time'}}}}})
+    assert not intent.slots._slots
+    assert intent.slots['date'].value == '2018-02-20'
+    assert intent.slots['date'] is intent.slots['date']
+    assert list(intent.slots._slots) == ['date']
+    assert sorted(intent.slots) == ['date', 'time'] and intent.slots['time'].value is None
+    assert 'date' in intent.slots and 'place' not in intent.slots
+    assert len(AVSIntent({'request': {'type': 'IntentRequest', 'intent': {'name': 'WhatsHappeningNext'}}}).slots) == 0
+
+
+def test_response_cache():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttl=60, clock=clock)
+    assert cache.get('a', 1) is None
+    cache.put('a', 1, {'a': 1})
+    cache.put('b', 1, {'b': 1})
+    assert cache.get('a', 1) == {'a': 1}
+    cache.put('c', 1, {'c': 1})  # Evicts b, the least recently used
+    assert cache.get('b', 1) is None and cache.get('c', 1) == {'c': 1}
+    assert (cache.hits, cache.misses) == (2, 2)
+    # A new calendar version drops everything built from the old one
+    assert cache.get('a', 2) is None
+    cache.put('a', 2, {'a': 2})
+    assert cache.get('a', 1) is None and cache.get('a', 2) is None
+    cache.put('a', 2, {'a': 2})
+    clock.now = 60
+    assert cache.get('a', 2) is None  # Expired
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return EventList([make_event('2018-02-20 10:00:00')])
+
+    results = [None] * 3
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, flight.do('week', fetch)))
+               for i in range(3)]
+    threads[0].start()
+    assert started.wait(1)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.coalesced < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(1)
+    assert len(calls) == 1
+    assert results[0] is results[1] is results[2]
+    assert (flight.calls, flight.coalesced, flight.in_flight) == (1, 2, 0)
+
+    # Once the call has finished, the next one makes its own
+    flight.do('week', fetch)
+    assert len(calls) == 2
+
+    # Errors are shared too; a caller whose wait times out gets None
+    release.clear()
+    started.clear()
+
+    def fail():
+        started.set()
+        release.wait(1)
+        raise ABEError('unreachable')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('day', fail)
+        except ABEError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(1)
+    assert flight.do('day', fail, timeout=0.01) is None
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_event_cache_version():
+    cache = EventCache()
+    version = cache.version
+    cache.get('2018-02-20', '2018-02-27')
+    assert cache.version == version
+    cache.put('2018-02-20', '2018-02-27', [])
+    assert cache.version > version
+    version = cache.version
+    cache.clear()
+    assert cache.version > version
+
+
+def test_tenants():
+    tenants = Tenants.from_config({'skill-b': {'url': 'http://b.example', 'zone': 'America/Los_Angeles'},
+                                   'skill-c': {'url': 'http://c.example', 'max_events': 100}},
+                                  max_events=3000, url='http://a.example', snapshot='/tmp/snapshots')
+    default, b, c = tenants
+    assert [tenant.name for tenant in tenants] == ['default', 'skill-b', 'skill-c']
+    assert (default.event_cache.max_events, b.event_cache.max_events, c.event_cache.max_events) == (1000, 1000, 100)
+    assert (default.client.host, b.client.host) == ('a.example', 'b.example')
+    assert default.snapshots is not None and b.snapshots is None
+    assert default.event_class is ABEEvent
+    assert b.event_class({'title': 'x', 'start': '2018-02-20 22:00:00'}).start.isoformat() == '2018-02-20T14:00:00-08:00'
+
+    assert tenants.for_request({'session': {'application': {'applicationId': 'skill-b'}}}) is b
+    assert tenants.for_request({'context': {'System': {'application': {'applicationId': 'skill-c'}}}}) is c
+    assert tenants.for_request({'session': {'application': {'applicationId': 'skill-z'}}}) is default
+    assert tenants.for_request({}) is default
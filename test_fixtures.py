@@ -19,10 +19,27 @@ intent = {
                     "what can I do"
                 ]
             },
+            {
+                "name": "AMAZON.MoreIntent",
+                "samples": []
+            },
+            {
+                "name": "AMAZON.NextIntent",
+                "samples": []
+            },
             {
                 "name": "AMAZON.StopIntent",
                 "samples": []
             },
+            {
+                "name": "MoreEvents",
+                "samples": [
+                    "more",
+                    "tell me more",
+                    "keep going"
+                ],
+                "slots": []
+            },
             {
                 "name": "WhatsHappeningNext",
                 "samples": [